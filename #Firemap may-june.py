@@ -2,21 +2,19 @@ import pandas as pd
 import folium
 import matplotlib.colors as mcolors
 import os
+from fire_layers import add_fire_layer
+from fire_data import load_fire_data, select_dates
 
 # Load the data from the CSV file
 file_path = 'D:\\Diploma\\modis_2023_Canada.csv'
-data = pd.read_csv(file_path)
-
-# Convert the acq_date column to datetime
-data['acq_date'] = pd.to_datetime(data['acq_date'])
+data = load_fire_data(file_path, columns=['latitude', 'longitude', 'brightness', 'acq_date'])
 
 # Initialize the map centered around Canada
 map_center = [56.1304, -106.3468]  # Coordinates of Canada
 m = folium.Map(location=map_center, zoom_start=4)
 
-# Function to calculate radius based on brightness
-def calculate_radius(brightness):
-    return (brightness - 300) / 10  # Adjust the divisor to control circle sizes
+# How the detections are drawn: 'canvas', 'cluster', 'heatmap' or 'markers' (one folium marker per fire)
+render_mode = 'canvas'
 
 # Function to get color for each week
 def get_color(week_number):
@@ -25,37 +23,35 @@ def get_color(week_number):
 
 # Function to add markers to the map
 def add_weekly_markers(week_data, color):
-    for _, row in week_data.iterrows():
-        lat = row['latitude']
-        lon = row['longitude']
-        brightness = row['brightness']
-        acq_date = row['acq_date']
-        radius = calculate_radius(brightness)
-        folium.CircleMarker(
-            location=[lat, lon],
-            radius=radius if radius > 1 else 1,  # Ensure the minimum radius is 1
-            popup=f'Brightness: {brightness}<br>Acquisition Date: {acq_date}',
-            color=color,
-            fill=True,
-            fill_color=color
-        ).add_to(m)
+    add_fire_layer(m, week_data, color=color, mode=render_mode)
 
 # Generate date ranges for each week in May and June
 start_dates = pd.date_range(start='2023-05-01', end='2023-06-30', freq='W-MON')
 end_dates = start_dates + pd.DateOffset(days=6)
 
+# Assign every detection of the season to the Monday its week starts on, in one pass
+season_data = select_dates(data, start_dates[0], end_dates[-1])
+week_start = season_data['acq_date'].dt.to_period('W-SUN').dt.start_time
+weekly = season_data.groupby(week_start)
+
+# Fire count and brightness statistics per week, weeks without fires have a count of 0
+week_stats = weekly['brightness'].agg(['count', 'mean', 'max']).reindex(start_dates)
+week_stats['count'] = week_stats['count'].fillna(0).astype(int)
+week_stats.index.name = 'week_start'
+print(week_stats)
+
 # Dictionary to store fire counts per week
 fire_counts = {}
 
-# Filter data for each week and add to the map
+# Add the fires of each week to the map
+week_groups = dict(list(weekly))
 for week_number, (start_date, end_date) in enumerate(zip(start_dates, end_dates)):
-    week_data = data[(data['acq_date'] >= start_date) & 
-                     (data['acq_date'] <= end_date)]
+    week_data = week_groups.get(start_date, season_data.iloc[:0])
     color = get_color(week_number)
     add_weekly_markers(week_data, color)
     
     # Store the count of fires for the week
-    fire_counts[f"Week {week_number + 1} ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')})"] = len(week_data)
+    fire_counts[f"Week {week_number + 1} ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')})"] = week_stats['count'][start_date]
 
 # Find the week with the most fire occurrences
 max_fire_week = max(fire_counts, key=fire_counts.get)
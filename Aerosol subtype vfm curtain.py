@@ -0,0 +1,22 @@
+import matplotlib.pyplot as plt
+from vfm_curtain import stream_subtype_curtain, plot_subtype_curtain
+
+# Directory (or list) of the VFM files of the overpass sequence or date range
+FILES = 'D:/CALIPSO/VFM SMOKE'
+
+# Optional longitude/latitude window, None keeps the whole track
+lon_range = None
+lat_range = (42, 62)
+
+# The curtain is downsampled to at most this many profiles, the files are read chunk_rows records at a time
+max_columns = 4000
+chunk_rows = 2000
+
+atype, lat, lon, boundaries = stream_subtype_curtain(FILES, max_columns, chunk_rows, lon_range, lat_range)
+print(f"Curtain of {atype.shape[1]} profiles from {len(boundaries)} files")
+
+# Plot
+tick_step = max(1, atype.shape[1] // 10)
+plot_subtype_curtain(atype, lat, lon, f'{len(boundaries)} VFM granules\nAerosol types', tick_step, boundaries)
+
+plt.show()
@@ -1,11 +1,12 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from pyhdf.SD import SD, SDC
-from pyhdf.HDF import HDF
-from pyhdf.VS import VS
 from matplotlib.colors import LinearSegmentedColormap, BoundaryNorm
 from scipy.interpolate import griddata
 import os
+from calipso_granule import CalipsoGranule
+from hdf_cache import DatasetCache
+from hdf_subset import find_row_range, index_range
+from curtain_regrid import stream_regrid_columns
 
 # List of colors and corresponding backscatter values
 cmap_colors = [
@@ -31,68 +32,80 @@ norm = BoundaryNorm(values, custom_cmap.N)
 
 # Load the HDF4 file
 FILE_NAME = 'D:/CALIPSO/L1 SMOKE/22_2_L1.hdf'
-hdf = HDF(FILE_NAME)
-vs = hdf.vstart()
-
-# Retrieve the altitude data
-xid = vs.find('metadata')
-altid = vs.attach(xid)
-altid.setfields('Lidar_Data_Altitudes')
-nrecs, _, _, _, _ = altid.inquire()
-altitude_data = altid.read(nRec=nrecs)
-altid.detach()
-
-# Convert altitude data to a numpy array
-altitude = np.array(altitude_data[0][0])
-
-# Load the scientific data set
-sd = SD(FILE_NAME, SDC.READ)
-total_backscatter_data = sd.select('Total_Attenuated_Backscatter_532')
-total_backscatter = total_backscatter_data[:]
-
-# Read geolocation datasets
-latitude_data = sd.select('Latitude')
-latitude = latitude_data[:]
-longitude_data = sd.select('Longitude')
-longitude = longitude_data[:]
-
-# Ensure latitude and total_backscatter are aligned
-min_length = min(len(latitude), total_backscatter.shape[0])
-latitude = latitude[:min_length]
-longitude = longitude[:min_length]
-total_backscatter = total_backscatter[:min_length, :]
-
-# Reshape latitude and longitude if needed
-if latitude.ndim > 1:
-    latitude = latitude.squeeze()
-if longitude.ndim > 1:
-    longitude = longitude.squeeze()
-
-# Filter altitude to be within 0 to 10 km
-altitude_filter = altitude <= 10
-altitude = altitude[altitude_filter]
-total_backscatter = total_backscatter[:, altitude_filter]
-
-# Filter data based on the specified longitude range
-lon_filter = (longitude >= -106.0) & (longitude <= -98.0)
-latitude = latitude[lon_filter]
-longitude = longitude[lon_filter]
-total_backscatter = total_backscatter[lon_filter, :]
-
-# Mask the missing data and set the background to dark blue
-masked_backscatter = np.ma.masked_where(total_backscatter == 0, total_backscatter)
-
-# Interpolate data on a regular grid
-x1, x2 = 0, len(latitude)
-nx = x2 - x1
-h1, h2 = 0, 10  # km
-nz = 500  # Number of pixels in the vertical
-x = np.arange(x1, x2)
-h = np.linspace(h2, h1, nz)
-grid_x, grid_h = np.meshgrid(x, h)
-points = np.array([(i, alt) for i in range(total_backscatter.shape[0]) for alt in altitude])
-values = total_backscatter.flatten()
-data = griddata(points, values, (grid_x, grid_h), method='linear')
+DATAFIELD_NAME = 'Total_Attenuated_Backscatter_532'
+
+# Cache of the decoded datasets, so replotting the same granule skips the HDF decoding
+cache = DatasetCache('D:/CALIPSO/cache', max_size_gb=20)
+
+# 'columns' interpolates each profile vertically, which is what the linear griddata does on
+# this profile x altitude grid, in a fraction of the time and memory. 'griddata' keeps the old path.
+regrid_method = 'columns'
+
+# With 'columns' the backscatter is read and regridded chunk_rows profiles at a time, so the working memory is
+# bounded by the chunk size and the float32 curtain. max_columns keeps at most that many profiles (every n-th,
+# not averaged) to also bound the curtain, None keeps every profile like the plots so far.
+chunk_rows = 2000
+max_columns = None
+
+with CalipsoGranule(FILE_NAME, cache) as granule:
+    # Retrieve the altitude data
+    altitude = granule.altitudes
+
+    # Read geolocation datasets
+    latitude = granule['Latitude']
+    longitude = granule['Longitude']
+
+    # Ensure latitude and total_backscatter are aligned
+    min_length = min(len(latitude), granule.shape(DATAFIELD_NAME)[0])
+    latitude = latitude[:min_length]
+    longitude = longitude[:min_length]
+
+    # Only the profiles around the longitude range and the altitude bins up to 10 km are read,
+    # the exact filters below are then applied to them
+    rows = find_row_range(longitude, -106.0, -98.0)
+    cols = index_range(np.where(altitude <= 10)[0])
+    latitude = latitude[rows]
+    longitude = longitude[rows]
+    altitude = altitude[cols]
+
+    # Reshape latitude and longitude if needed
+    if latitude.ndim > 1:
+        latitude = latitude.squeeze()
+    if longitude.ndim > 1:
+        longitude = longitude.squeeze()
+
+    # Filter altitude to be within 0 to 10 km
+    altitude_filter = altitude <= 10
+    altitude = altitude[altitude_filter]
+
+    # Filter data based on the specified longitude range
+    lon_filter = (longitude >= -106.0) & (longitude <= -98.0)
+    latitude = latitude[lon_filter]
+    longitude = longitude[lon_filter]
+    profile_rows = rows.start + np.flatnonzero(lon_filter)  # Records of the granule in the curtain
+
+    # Interpolate data on a regular grid
+    x1, x2 = 0, len(latitude)
+    nx = x2 - x1
+    h1, h2 = 0, 10  # km
+    nz = 500  # Number of pixels in the vertical
+    x = np.arange(x1, x2)
+    h = np.linspace(h2, h1, nz)
+
+    if regrid_method == 'columns':
+        stride = 1 if max_columns is None else max(1, -(-nx // max_columns))
+
+        # Backscatter of the records start to stop, altitude bins up to 10 km only
+        def read_rows(start, stop):
+            return granule.read(DATAFIELD_NAME, slice(start, stop), cols)[:, altitude_filter]
+
+        data = stream_regrid_columns(read_rows, profile_rows[::stride], altitude, h, chunk_rows)
+    else:
+        total_backscatter = granule.read(DATAFIELD_NAME, rows, cols)[:, altitude_filter][lon_filter, :]
+        grid_x, grid_h = np.meshgrid(x, h)
+        points = np.column_stack([np.repeat(x, len(altitude)), np.tile(altitude, len(x))])
+        values = total_backscatter.flatten()
+        data = griddata(points, values, (grid_x, grid_h), method='linear')
 
 # X axis ticks
 xvals = []
@@ -1,22 +1,20 @@
-import pandas as pd
 import folium
+from fire_layers import add_fire_layer
+from fire_data import load_fire_data, select_dates
 
 # Load the data from the Excel file
 file_path = 'D:\\Diploma\\modis_2023_Canada.csv'
-data = pd.read_csv(file_path)
+data = load_fire_data(file_path, columns=['latitude', 'longitude', 'brightness', 'acq_date'])
 
 # Assuming the Excel file has columns named 'Latitude' and 'Longitude'
 latitude_column = 'latitude'
 longitude_column = 'longitude'
 brightness_column = 'brightness'  # Adjust this based on your file
 
-# Convert the acq_date column to datetime
-data['acq_date'] = pd.to_datetime(data['acq_date'])
-
 # Filter data for the week of 01/05/2023 to 07/05/2023
 start_date = '2023-05-15'
 end_date = '2023-05-25'
-filtered_data = data[(data['acq_date'] >= start_date) & (data['acq_date'] <= end_date)]
+filtered_data = select_dates(data, start_date, end_date)
 
 # Aggregate by date to find the date with the most fires
 date_counts = filtered_data['acq_date'].value_counts()
@@ -27,7 +25,7 @@ print(f"The date with the most fires: {most_fires_date}, Number of fires: {most_
 
 # Filter data for the specific date 19/05/23
 specific_date = '2023-05-19'
-fires_on_specific_date = filtered_data[filtered_data['acq_date'] == specific_date]
+fires_on_specific_date = select_dates(filtered_data, specific_date)
 
 # Calculate the average latitude and longitude
 avg_latitude = fires_on_specific_date['latitude'].mean()
@@ -39,25 +37,13 @@ print(f"Average Latitude (19/05/23): {avg_latitude}, Average Longitude (19/05/23
 map_center = [56.1304, -106.3468]  # Coordinates of Canada
 m = folium.Map(location=map_center, zoom_start=4)
 
-# Function to calculate radius based on brightness
-def calculate_radius(brightness):
-    return (brightness - 300) / 10  # Adjust the divisor to control circle sizes
+# How the detections are drawn: 'canvas', 'cluster', 'heatmap' or 'markers' (one folium marker per fire)
+render_mode = 'canvas'
 
 # Add data points to the map for the specific date
-for _, row in fires_on_specific_date.iterrows():
-    lat = row['latitude']
-    lon = row['longitude']
-    brightness = row['brightness']
-    acq_date = row['acq_date']
-    radius = calculate_radius(brightness)
-    folium.CircleMarker(
-        location=[lat, lon],
-        radius=radius if radius > 1 else 1,  # Ensure the minimum radius is 1
-        popup=f'Brightness: {brightness}<br>Acquisition Date: {acq_date}<br>Latitude: {lat}<br>Longitude: {lon}',
-        color='red',
-        fill=True,
-        fill_color='red'
-    ).add_to(m)
+add_fire_layer(m, fires_on_specific_date, color='red', mode=render_mode,
+               popup_fields={'Brightness': 'brightness', 'Acquisition Date': 'acq_date',
+                             'Latitude': 'latitude', 'Longitude': 'longitude'})
 
 # Save the map to an HTML file
 m.save('fire_map_specific_date.html')
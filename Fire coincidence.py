@@ -0,0 +1,43 @@
+import os
+import glob
+from fire_data import load_fire_data
+from fire_coincidence import read_track, find_coincidences
+from table_io import read_table, TableWriter
+
+# MODIS fire detections
+fire_path = 'D:\\Diploma\\modis_2023_Canada.csv'
+
+# Directories of the CALIPSO granules (L1 or L2) whose tracks are checked
+directories = ['D:/CALIPSO/L1 SMOKE', 'D:/CALIPSO/L2 PRO SMOKE']
+
+# A fire counts for a profile when it is within max_distance km and time_window hours (None for any time)
+max_distance = 50
+time_window = 12
+
+# Coincidence table, appended after every granule (.parquet or .csv)
+output_path = 'D:/Diploma/fire_coincidences.parquet'
+
+fires = load_fire_data(fire_path, columns=['latitude', 'longitude', 'brightness', 'frp', 'acq_date', 'acq_time'])
+
+with TableWriter(output_path) as writer:
+    for directory in directories:
+        for file in sorted(glob.glob(f"{directory}/*.hdf")):
+            try:
+                lat, lon, times = read_track(file)
+            except Exception as e:
+                print(f"Error reading file {file}: {e}")
+                continue
+
+            coincidences = find_coincidences(lat, lon, times, fires, max_distance, time_window)
+            coincidences.insert(0, 'granule', file)
+            print(f"{file}: {len(coincidences)} profiles near {coincidences['fire_count'].sum()} fire matches")
+            writer.write(coincidences)
+
+print(f"Processing complete. Results saved to '{output_path}'")
+
+# Overpasses with the most fires nearby
+if os.path.exists(output_path):
+    results = read_table(output_path)
+    overpasses = results.groupby('granule').agg(profiles=('profile_index', 'size'), fires=('fire_count', 'sum'),
+                                                nearest_distance_km=('nearest_distance_km', 'min'), frp_sum=('frp_sum', 'sum'))
+    print(overpasses.sort_values('frp_sum', ascending=False))
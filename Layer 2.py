@@ -1,11 +1,12 @@
+import os
 import pandas as pd
-from pyhdf.SD import SD, SDC
 import numpy as np
-
-def read_hdf_data(hdf_file, dataset_name):
-    hdf = SD(hdf_file, SDC.READ)
-    data = hdf.select(dataset_name)[:]
-    return data
+from calipso_granule import CalipsoGranule
+from hdf_cache import DatasetCache
+from hdf_subset import find_row_range
+from vfm_decode import decode_vfm
+from table_io import read_table, TableWriter
+from run_manifest import RunManifest
 
 def extract_aerosol_layers(vfm_data, layer_top_altitude, layer_base_altitude, lat, lon, target_lat, max_alt=10):
     aerosol_types = {
@@ -19,12 +20,11 @@ def extract_aerosol_layers(vfm_data, layer_top_altitude, layer_base_altitude, la
         7: 'Other'
     }
     
-    data_ft = vfm_data & 7
-    vfm_data[(data_ft > 3) | (data_ft < 3)] = 0
-    vfm_data = (vfm_data >> 9) & 7
+    # Aerosol subtype of the tropospheric aerosol layers, 0 for every other feature
+    vfm_data = decode_vfm(vfm_data, ['aerosol_subtype'])['aerosol_subtype']
 
-    lat = np.array(lat)
-    lon = np.array(lon)
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
     if len(lat.shape) == 1:
         lat = lat[:, np.newaxis]
     if len(lon.shape) == 1:
@@ -33,78 +33,138 @@ def extract_aerosol_layers(vfm_data, layer_top_altitude, layer_base_altitude, la
     valid_top_altitude = (layer_top_altitude <= max_alt) & (layer_top_altitude != -9999)
     valid_base_altitude = (layer_base_altitude <= max_alt) & (layer_base_altitude != -9999)
 
-    lat_range_mask = (lat >= target_lat[1]) & (lat <= target_lat[0])
+    lat_range_mask = (lat[:, :1] >= target_lat[1]) & (lat[:, :1] <= target_lat[0])
 
-    valid_data_mask = np.zeros(vfm_data.shape, dtype=bool)
-    for i in range(vfm_data.shape[0]):
-        if lat_range_mask[i, 0]:
-            valid_data_mask[i, :] = valid_top_altitude[i, :] & valid_base_altitude[i, :]
+    # Layers of the profiles inside the latitude window, broadcast over the layers of every profile
+    valid_data_mask = lat_range_mask & valid_top_altitude & valid_base_altitude
+    valid_rows = np.nonzero(valid_data_mask)[0]
 
     valid_data = vfm_data[valid_data_mask]
     valid_layer_top_altitudes = layer_top_altitude[valid_data_mask]
     valid_layer_base_altitudes = layer_base_altitude[valid_data_mask]
-    valid_latitudes = np.repeat(lat[:, np.newaxis], vfm_data.shape[1], axis=1)[valid_data_mask]
-    valid_longitudes = np.repeat(lon[:, np.newaxis], vfm_data.shape[1], axis=1)[valid_data_mask]
-    
-    unique_aerosols = np.unique(valid_data)
+    valid_lat_min = lat.min(axis=1)[valid_rows]
+    valid_lat_max = lat.max(axis=1)[valid_rows]
+
+    # Group the layers by aerosol type and reduce every group in one pass
+    unique_aerosols, inverse = np.unique(valid_data, return_inverse=True)
     aerosol_layers_info = []
-    
-    for aerosol in unique_aerosols:
-        aerosol_mask = valid_data == aerosol
-        top_altitudes = valid_layer_top_altitudes[aerosol_mask]
-        base_altitudes = valid_layer_base_altitudes[aerosol_mask]
-        if len(top_altitudes) > 0 and len(base_altitudes) > 0:
-            top_altitude = np.max(top_altitudes)
-            bottom_altitude = np.min(base_altitudes)
-            aerosol_layers_info.append({
-                'type': aerosol_types.get(aerosol, 'Unknown'),
-                'top_altitude': top_altitude,
-                'bottom_altitude': bottom_altitude,
-                'lat_min': np.min(valid_latitudes[aerosol_mask]),
-                'lat_max': np.max(valid_latitudes[aerosol_mask])
-            })
+    if len(unique_aerosols) == 0:
+        return aerosol_layers_info
+
+    order = np.argsort(inverse, kind='stable')
+    starts = np.searchsorted(inverse[order], np.arange(len(unique_aerosols)))
+    top_altitudes = np.maximum.reduceat(valid_layer_top_altitudes[order], starts)
+    bottom_altitudes = np.minimum.reduceat(valid_layer_base_altitudes[order], starts)
+    lat_mins = np.minimum.reduceat(valid_lat_min[order], starts)
+    lat_maxs = np.maximum.reduceat(valid_lat_max[order], starts)
+
+    for aerosol, top_altitude, bottom_altitude, lat_min, lat_max in zip(unique_aerosols, top_altitudes, bottom_altitudes, lat_mins, lat_maxs):
+        aerosol_layers_info.append({
+            'type': aerosol_types.get(aerosol, 'Unknown'),
+            'top_altitude': top_altitude,
+            'bottom_altitude': bottom_altitude,
+            'lat_min': lat_min,
+            'lat_max': lat_max
+        })
     
     return aerosol_layers_info
 
-# Read the Excel file
-excel_file_path = 'D:/Diploma/Backscatter plot/latitudes.xlsx'
-df = pd.read_excel(excel_file_path)
+# Work list of granules and latitude windows (.xlsx, .csv or .parquet)
+input_path = 'D:/Diploma/Backscatter plot/latitudes.xlsx'
 
-# Prepare to store results
-results = []
+# Results, appended after every granule (.parquet or .csv)
+output_path = 'D:/Diploma/Backscatter plot/aerosol_layers_results.parquet'
 
-# Process each file
-for _, row in df.iterrows():
-    lat_max = row['Lat_Max']
-    lat_min = row['Lat_Min']
-    hdf_file_base = row['File_Name'].replace('_PRO', '_LAY')
-    hdf_file = f"D:/CALIPSO/L2 LAY SMOKE/{hdf_file_base}"
-    
-    # Read data from HDF file
-    latitude_data = read_hdf_data(hdf_file, 'Latitude')
-    longitude_data = read_hdf_data(hdf_file, 'Longitude')
-    vfm_data = read_hdf_data(hdf_file, 'Feature_Classification_Flags')
-    layer_top_altitude = read_hdf_data(hdf_file, 'Layer_Top_Altitude')
-    layer_base_altitude = read_hdf_data(hdf_file, 'Layer_Base_Altitude')
-    
-    target_lat = (lat_max, lat_min)
-    aerosol_layers_info = extract_aerosol_layers(vfm_data, layer_top_altitude, layer_base_altitude, latitude_data, longitude_data, target_lat)
-    
-    for layer in aerosol_layers_info:
-        results.append({
-            'Layer_Base_Altitude': layer['bottom_altitude'],
-            'Layer_Top_Altitude': layer['top_altitude'],
-            'Number_of_Layers': len(aerosol_layers_info),
-            'Lat_Min': layer['lat_min'],
-            'Lat_Max': layer['lat_max'],
-            'Subtype': layer['type'],
-            'File_Name': row['File_Name']
-        })
+# Columns of the results, the output has them even when no aerosol layer is found
+result_columns = ['Layer_Base_Altitude', 'Layer_Top_Altitude', 'Number_of_Layers', 'Lat_Min', 'Lat_Max', 'Subtype',
+                  'File_Name', 'Input_Row']
+
+# Optional Excel export of the results at the end, None to skip it
+excel_path = 'D:/Diploma/Backscatter plot/aerosol_layers_results.xlsx'
+
+# Granules already processed are recorded here and skipped by the next run unless the granule or its rows of
+# the work list changed, None to process everything every time. force = True processes every granule again.
+manifest_path = 'D:/Diploma/Backscatter plot/aerosol_layers_manifest.jsonl'
+force = False
+
+# Results of every granule on their own (.parquet), reused for the granules the next run skips
+parts_dir = 'D:/Diploma/Backscatter plot/aerosol_layers_parts'
+
+df = read_table(input_path, columns=['Lat_Max', 'Lat_Min', 'File_Name'])
+
+# Cache of the decoded datasets, so rerunning the same granules skips the HDF decoding
+cache = DatasetCache('D:/CALIPSO/cache', max_size_gb=20)
+
+manifest = RunManifest(manifest_path, force=force) if manifest_path is not None else None
+skipped = 0
+
+# Process each granule once for all the rows (latitude windows) that point at it
+lay_files = df['File_Name'].str.replace('_PRO', '_LAY')
+with TableWriter(output_path, columns=result_columns) as writer:
+    for hdf_file_base, group in df.groupby(lay_files, sort=False):
+        hdf_file = f"D:/CALIPSO/L2 LAY SMOKE/{hdf_file_base}"
+        part_path = os.path.join(parts_dir, f"{os.path.splitext(hdf_file_base)[0]}.parquet")
+        params = group.reset_index().values.tolist()
+
+        # Unchanged granule: its results are copied from the previous run
+        if manifest is not None and manifest.is_done(hdf_file, params):
+            for output in manifest.outputs(hdf_file):
+                writer.write(read_table(output))
+            skipped += 1
+            continue
+
+        with CalipsoGranule(hdf_file, cache) as granule:
+            # Read data from HDF file, only the profiles covering the latitude windows of this granule
+            latitude_data = granule['Latitude']
+            first_lat = np.reshape(latitude_data, (len(latitude_data), -1))[:, 0]
+            windows = [find_row_range(first_lat, row['Lat_Min'], row['Lat_Max']) for _, row in group.iterrows()]
+            # When every window misses the granule the slab is empty and the datasets read are empty too
+            windows = [window for window in windows if window.stop > window.start] or [slice(0, 0)]
+            rows = slice(min(window.start for window in windows), max(window.stop for window in windows))
+
+            latitude_data = latitude_data[rows]
+            longitude_data = granule.read('Longitude', rows)
+            vfm_data = granule.read('Feature_Classification_Flags', rows)
+            layer_top_altitude = granule.read('Layer_Top_Altitude', rows)
+            layer_base_altitude = granule.read('Layer_Base_Altitude', rows)
+
+        # Evaluate every latitude window against the same arrays
+        first_lat = first_lat[rows]
+        results = []
+        for index, row in group.iterrows():
+            window = find_row_range(first_lat, row['Lat_Min'], row['Lat_Max'])
+            target_lat = (row['Lat_Max'], row['Lat_Min'])
+            aerosol_layers_info = extract_aerosol_layers(vfm_data[window], layer_top_altitude[window], layer_base_altitude[window],
+                                                         latitude_data[window], longitude_data[window], target_lat)
+
+            for layer in aerosol_layers_info:
+                results.append({
+                    'Layer_Base_Altitude': layer['bottom_altitude'],
+                    'Layer_Top_Altitude': layer['top_altitude'],
+                    'Number_of_Layers': len(aerosol_layers_info),
+                    'Lat_Min': layer['lat_min'],
+                    'Lat_Max': layer['lat_max'],
+                    'Subtype': layer['type'],
+                    'File_Name': row['File_Name'],
+                    'Input_Row': index
+                })
 
-# Create a DataFrame for the results
-results_df = pd.DataFrame(results)
+        # Save the results of this granule right away
+        results = pd.DataFrame(results, columns=result_columns)
+        writer.write(results)
+        if manifest is not None:
+            os.makedirs(parts_dir, exist_ok=True)
+            with TableWriter(part_path) as part:
+                part.write(results)
+            manifest.record(hdf_file, [part_path] if len(results) else [], params)
 
-# Save the results to a new Excel file
-results_df.to_excel('D:/Diploma/Backscatter plot/aerosol_layers_results.xlsx', index=False)
+if manifest is not None:
+    print(f"Skipped {skipped} granules already processed (manifest '{manifest_path}')")
+print(f"Processing complete. Results saved to '{output_path}'")
 
-print("Processing complete. Results saved to 'D:/Diploma/Backscatter plot/aerosol_layers_results.xlsx'")
+# Export the results to Excel, in the order of the work list
+if excel_path is not None:
+    results_df = read_table(output_path)
+    results_df = results_df.sort_values('Input_Row', kind='stable').drop(columns='Input_Row')
+    results_df.to_excel(excel_path, index=False)
+    print(f"Results exported to '{excel_path}'")
@@ -0,0 +1,47 @@
+import os
+import logging
+from calipso_grid import process_hdf_files
+from hdf_cache import DatasetCache
+
+if __name__ == '__main__':
+    # Messages of the run, logging.DEBUG also prints every grid point and its matched indices
+    log_config = {'level': logging.INFO, 'format': '%(message)s'}
+    logging.basicConfig(**log_config)
+
+    # Directory containing the HDF files
+    directory = 'D:/CALIPSO/L2 PRO SMOKE'
+
+    # Products to extract and the output directory for saving their plots.
+    # Every granule is read once for all the products listed here.
+    products = {
+        'backscatter': 'D:/Diploma/Backscatter plot',
+        'depolarization': 'D:/Diploma/Depolarization plot',
+        'angstrom': 'D:/Diploma/Angstorm plot',
+    }
+
+    # Latitude and Longitude ranges and steps
+    lat_range = (62, 42)
+    lon_range = (-120, 20)
+    lat_step = 2
+    lon_step = 2
+
+    # Number of worker processes (1 processes the files one at a time), the plots are rendered by as many more
+    workers = os.cpu_count()
+
+    # Cache of the decoded datasets, so rerunning the same granules skips the HDF decoding
+    cache = DatasetCache('D:/CALIPSO/cache', max_size_gb=20)
+
+    # Every selected profile is also saved here (float32 values and altitudes) for the statistics, None to skip it
+    store_path = 'D:/Diploma/Profile store'
+
+    # Time spent in every stage of the run, saved as JSON (None to only log it)
+    report_path = 'D:/Diploma/Profile plot timing.json'
+
+    # Granules already processed are recorded here and skipped by the next run unless they or the parameters
+    # changed, None to process everything every time. force = True processes every granule again.
+    manifest_path = 'D:/Diploma/Profile plot manifest.jsonl'
+    force = False
+
+    # Process the HDF files and plot the profiles of every product
+    process_hdf_files(directory, lat_range, lon_range, lat_step, lon_step, products, workers, cache, store_path=store_path, report_path=report_path,
+                      manifest_path=manifest_path, force=force, log_config=log_config)
@@ -0,0 +1,38 @@
+import os
+import glob
+from profile_stats import stats_from_store, granules_stats
+from hdf_cache import DatasetCache
+from table_io import TableWriter
+
+if __name__ == '__main__':
+    # Product to summarise: 'backscatter', 'depolarization' or 'angstrom'
+    product = 'backscatter'
+
+    # Source of the profiles: the profile store written by the grid scripts,
+    # or None to use every profile of the L2 PRO granules in directory
+    store_path = 'D:/Diploma/Profile store'
+    directory = 'D:/CALIPSO/L2 PRO SMOKE'
+
+    # Width of the latitude bands of the granules (centred on the grid latitudes)
+    lat_step = 2
+
+    # Number of worker processes for the granules (1 processes the files one at a time)
+    workers = os.cpu_count()
+
+    # Cache of the decoded datasets, so rerunning the same granules skips the HDF decoding
+    cache = DatasetCache('D:/CALIPSO/cache', max_size_gb=20)
+
+    # Statistics per latitude band, subtype and altitude bin (.parquet or .csv)
+    output_path = f'D:/Diploma/{product}_statistics.csv'
+
+    if store_path is not None:
+        stats = stats_from_store(store_path, product)
+    else:
+        files = sorted(glob.glob(f"{directory}/*.hdf"))
+        stats = granules_stats(files, product, lat_step, workers=workers, cache=cache)
+
+    summary = stats.summary()
+    with TableWriter(output_path) as writer:
+        writer.write(summary)
+    print(summary)
+    print(f"Statistics saved to '{output_path}'")
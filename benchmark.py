@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import shutil
+import subprocess
+import pandas as pd
+from synthetic_granules import write_archive
+from table_io import TableWriter
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Function to write a path inside the scripts (forward slashes, so it is a valid string literal on Windows too)
+def _path(*parts):
+    return os.path.join(*parts).replace('\\', '/')
+
+
+# Functions returning, for a pipeline: the script, the text replacements pointing it at the synthetic archive,
+# the amount of work of one run and its unit
+def grid_plots(archive, run_dir, workers):
+    replacements = {
+        'D:/CALIPSO/L2 PRO SMOKE': _path(os.path.dirname(archive['l2pro'][0])),
+        'D:/Diploma': _path(run_dir),
+        'D:/CALIPSO/cache': _path(run_dir, 'cache'),
+        'workers = os.cpu_count()': f'workers = {workers}',
+        'force = False': 'force = True',  # Time the processing, not the manifest skipping every granule
+    }
+    return 'Profile plot grid.py', replacements, archive['sizes']['l2pro'] * len(archive['l2pro']), 'profiles'
+
+
+def layer_2(archive, run_dir, workers):
+    # Work list: every L2 granule with the latitude windows of the grid
+    rows = [{'File_Name': os.path.basename(path).replace('_LAY', '_PRO'), 'Lat_Max': lat, 'Lat_Min': lat - 2}
+            for path in archive['lay'] for lat in range(62, 42, -2)]
+    pd.DataFrame(rows).to_excel(os.path.join(run_dir, 'latitudes.xlsx'), index=False)
+    replacements = {
+        'D:/CALIPSO/L2 LAY SMOKE': _path(os.path.dirname(archive['lay'][0])),
+        'D:/Diploma/Backscatter plot': _path(run_dir),
+        'D:/CALIPSO/cache': _path(run_dir, 'cache'),
+        'force = False': 'force = True',
+    }
+    return 'Layer 2.py', replacements, archive['sizes']['lay'] * len(archive['lay']), 'profiles'
+
+
+def vfm_curtain(archive, run_dir, workers):
+    replacements = {'D:/CALIPSO/VFM SMOKE': _path(os.path.dirname(archive['vfm'][0]))}
+    return 'Aerosol subtype vfm curtain.py', replacements, archive['sizes']['vfm'] * len(archive['vfm']), 'records'
+
+
+def backscatter_curtain(archive, run_dir, workers):
+    replacements = {
+        'D:/CALIPSO/L1 SMOKE/22_2_L1.hdf': _path(archive['l1'][0]),
+        'D:/CALIPSO/cache': _path(run_dir, 'cache'),
+    }
+    return 'Backscatter vol 2.py', replacements, archive['sizes']['l1'], 'profiles'
+
+
+def fire_map(archive, run_dir, workers):
+    replacements = {'D:\\\\Diploma\\\\modis_2023_Canada.csv': _path(archive['fires'][0])}
+    return 'Fire Map.py', replacements, archive['sizes']['fires'], 'fires'
+
+
+def fire_map_season(archive, run_dir, workers):
+    replacements = {'D:\\\\Diploma\\\\modis_2023_Canada.csv': _path(archive['fires'][0])}
+    return '#Firemap may-june.py', replacements, archive['sizes']['fires'], 'fires'
+
+
+PIPELINES = {
+    'grid plots': grid_plots,
+    'layer 2': layer_2,
+    'vfm curtain': vfm_curtain,
+    'backscatter curtain': backscatter_curtain,
+    'fire map': fire_map,
+    'fire map may-june': fire_map_season,
+}
+
+
+# Function to run a copy of a script with the replacements in its own process (Agg backend, so plt.show
+# returns at once). The output of the script goes to output.log in run_dir.
+# Returns (seconds, return code).
+def run_script(script, replacements, run_dir):
+    with open(os.path.join(REPO_DIR, script), encoding='utf-8') as f:
+        source = f.read()
+    for old, new in replacements.items():
+        if old not in source:
+            raise ValueError(f"'{script}' does not contain '{old}' any more, update the benchmark")
+        source = source.replace(old, new)
+
+    path = os.path.join(run_dir, 'benchmark_script.py')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(source)
+
+    env = dict(os.environ, MPLBACKEND='Agg')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+    start = time.perf_counter()
+    with open(os.path.join(run_dir, 'output.log'), 'w') as log:
+        result = subprocess.run([sys.executable, path], cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return time.perf_counter() - start, result.returncode
+
+
+# Function to time every pipeline on synthetic archives of every size ({name: scale of a real granule}).
+# Each pipeline runs repeat times: the first run starts without any cache (dataset cache, fire parquet copy),
+# the next ones show the cached speed. Returns one row per run with the throughput in units per second.
+def run_benchmark(work_dir, sizes, pipelines=None, granules=2, repeat=2, workers=1):
+    pipelines = list(PIPELINES) if pipelines is None else pipelines
+    results = []
+    for size, scale in sizes.items():
+        start = time.perf_counter()
+        archive = write_archive(os.path.join(work_dir, f'data {size}'), granules, scale)
+        print(f"Synthetic archive '{size}' ({archive['sizes']}) written in {time.perf_counter() - start:.1f} s")
+
+        for pipeline in pipelines:
+            run_dir = os.path.join(work_dir, f'run {size}', pipeline)
+            shutil.rmtree(run_dir, ignore_errors=True)
+            os.makedirs(run_dir)
+            fire_cache = os.path.splitext(archive['fires'][0])[0] + '.parquet'
+            if os.path.exists(fire_cache):
+                os.remove(fire_cache)
+
+            script, replacements, work, unit = PIPELINES[pipeline](archive, run_dir, workers)
+            for run in range(1, repeat + 1):
+                seconds, returncode = run_script(script, replacements, run_dir)
+                results.append({
+                    'Size': size, 'Scale': scale, 'Pipeline': pipeline, 'Run': run, 'Cached': run > 1,
+                    'Seconds': round(seconds, 3), 'Work': work, 'Unit': unit,
+                    'Throughput': round(work / seconds, 1), 'Return_Code': returncode,
+                })
+                status = 'ok' if returncode == 0 else f"failed ({returncode}), see {os.path.join(run_dir, 'output.log')}"
+                print(f"{size:>8} {pipeline:<20} run {run}: {seconds:8.2f} s {work / seconds:12.1f} {unit}/s {status}")
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    # Folder of the synthetic archives and of the runs
+    work_dir = 'D:/Diploma/benchmark'
+
+    # Data sizes as a fraction of real granules (1.0 = a real L1/L2/VFM granule and a season of fires)
+    sizes = {'small': 0.05, 'medium': 0.25, 'full': 1.0}
+    granules = 2
+
+    # Pipelines to time, None for all of them: grid plots, layer 2, vfm curtain, backscatter curtain, fire map, fire map may-june
+    pipelines = None
+    repeat = 2
+    workers = 1
+
+    # Timings of every run (.csv or .parquet)
+    report_path = 'D:/Diploma/benchmark/benchmark.csv'
+
+    results = run_benchmark(work_dir, sizes, pipelines, granules, repeat, workers)
+    with TableWriter(report_path) as writer:
+        writer.write(results)
+    print(results.pivot_table(index='Pipeline', columns='Size', values='Throughput', aggfunc='max'))
+    print(f"Benchmark saved to '{report_path}'")
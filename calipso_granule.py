@@ -0,0 +1,130 @@
+import os
+import re
+import numpy as np
+from pyhdf.SD import SD, SDC
+from pyhdf.HDF import HDF
+import pyhdf.VS
+from hdf_cache import load_dataset
+from hdf_subset import slab_name
+
+# Altitude grids already read, by product and version. Lidar_Data_Altitudes is the same for every
+# granule of a product version, so it is only read once per process for each of them.
+_ALTITUDES = {}
+
+
+# Function to get the VALUE of an object of the ECS core metadata (ODL text), None when it is not there
+def _metadata_value(metadata, name):
+    match = re.search(rf'OBJECT\s*=\s*{name}\s(.*?)END_OBJECT\s*=\s*{name}\s', metadata, re.S)
+    if match is None:
+        return None
+    value = re.search(r'VALUE\s*=\s*"?([^"\r\n]*)"?', match.group(1))
+    return value.group(1).strip() if value else None
+
+
+# Function to find the product and version of a granule (CAL_LID_L2_05kmAPro-Standard-V4-51).
+# They are read from the SHORTNAME and VERSIONID of the coremetadata global attribute when sd (the open SD
+# handle) is given, which does not depend on the file name, otherwise from the CALIPSO file name
+# (CAL_LID_L2_05kmAPro-Standard-V4-51.2023-05-19T10-11-12ZN.hdf).
+# Returns None when neither has it, the altitudes are then only kept for the granule itself.
+def granule_product(file, sd=None):
+    if sd is not None:
+        metadata = sd.attributes().get('coremetadata')
+        if isinstance(metadata, str):
+            short_name = _metadata_value(metadata, 'SHORTNAME')
+            if short_name:
+                version = _metadata_value(metadata, 'VERSIONID')
+                return short_name if not version else f"{short_name} {version}"
+    match = re.match(r'(CAL_[^.]+-V\d+-\d+)\.', os.path.basename(file))
+    return match.group(1) if match else None
+
+
+# Reader of one CALIPSO granule (L1, L2 or VFM).
+# The SDS fields are read on first access (through the dataset cache when there is one) and kept,
+# granule['Latitude'] reads a whole field and granule.read(name, rows, cols) only a slab of it.
+# The handles are closed by close(), or when leaving a with block.
+class CalipsoGranule:
+    def __init__(self, file, cache=None):
+        self.file = file
+        self.cache = cache
+        self.sd = SD(file, SDC.READ)
+        self._hdf = None
+        self._vs = None
+        self._datasets = {}
+        self._altitudes = None
+
+    def __getitem__(self, name):
+        if name not in self._datasets:
+            self._datasets[name] = load_dataset(self.cache, self.file, name, lambda: self._read(name, slice(None)))
+        return self._datasets[name]
+
+    def __contains__(self, name):
+        return name in self.sd.datasets()
+
+    def _read(self, name, rows, cols=None):
+        sds = self.sd.select(name)
+        try:
+            return sds[rows] if cols is None else sds[rows, cols]
+        finally:
+            sds.endaccess()
+
+    # Function to read the rows x cols slab of a dataset (cols=slice(None) for every column).
+    # An empty slab gives an empty array: pyhdf cannot read one (it crashes, fails or reads the whole dataset).
+    def read(self, name, rows, cols=slice(None)):
+        shape = self.shape(name)
+        sizes = [len(range(*index.indices(size))) for index, size in zip((rows, cols), shape)]
+        if 0 in sizes:
+            sample = self._read(name, slice(0, 1), slice(0, 1) if len(shape) > 1 else None)
+            return np.empty(tuple(sizes) + shape[2:], dtype=sample.dtype)
+        return load_dataset(self.cache, self.file, slab_name(name, rows, cols), lambda: self._read(name, rows, cols))
+
+    # Function to get the dimensions of a dataset without reading it
+    def shape(self, name):
+        sds = self.sd.select(name)
+        try:
+            dims = sds.info()[2]
+        finally:
+            sds.endaccess()
+        return tuple(dims) if isinstance(dims, list) else (dims,)
+
+    # Lidar_Data_Altitudes of the metadata vdata (km), read-only and shared by the granules of the same product
+    @property
+    def altitudes(self):
+        if self._altitudes is None:
+            product = granule_product(self.file, self.sd)
+            altitudes = _ALTITUDES.get(product) if product is not None else None
+            if altitudes is None:
+                altitudes = np.array(load_dataset(self.cache, self.file, 'Lidar_Data_Altitudes', self._read_altitudes))
+                altitudes.flags.writeable = False
+                if product is not None:
+                    _ALTITUDES[product] = altitudes
+            self._altitudes = altitudes
+        return self._altitudes
+
+    def _read_altitudes(self):
+        if self._vs is None:
+            self._hdf = HDF(self.file)
+            self._vs = self._hdf.vstart()
+        altid = self._vs.attach(self._vs.find('metadata'))
+        try:
+            altid.setfields('Lidar_Data_Altitudes')
+            nrecs = altid.inquire()[0]
+            altitude_data = altid.read(nRec=nrecs)
+        finally:
+            altid.detach()
+        return np.asarray(altitude_data, dtype=np.float64)[:, 0].ravel()
+
+    def close(self):
+        if self._vs is not None:
+            self._vs.end()
+            self._hdf.close()
+            self._vs = None
+            self._hdf = None
+        if self.sd is not None:
+            self.sd.end()
+            self.sd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,523 @@
+import os
+import glob
+import time
+import logging
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from calipso_granule import CalipsoGranule
+from hdf_subset import find_row_range, intersect_ranges, index_range
+from profile_store import ProfileStore, ProfileStoreWriter
+from run_manifest import RunManifest
+from stage_timer import StageTimer
+
+logger = logging.getLogger(__name__)
+
+
+# Function to create the grid points used by the profile grid scripts
+def make_grid(lat_range, lon_range, lat_step, lon_step):
+    grid_lats = np.arange(lat_range[0], lat_range[1] - lat_step, -lat_step)
+    grid_lons = np.arange(lon_range[0], lon_range[1], lon_step)
+    return grid_lats, grid_lons
+
+
+# Function to expand (start, count) pairs into one flat index array
+def _expand_ranges(starts, counts):
+    total = counts.sum()
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+# Function to find, for every row of the track, the grid values within the tolerance.
+# A row matches if any of its samples (e.g. the 3 columns of L2 Latitude) is close enough.
+def _axis_hits(values, grid, tolerance):
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    order = np.argsort(grid, kind='stable')
+    sorted_grid = np.asarray(grid)[order]
+
+    # Widen the searchsorted window by one on each side, then re-check with the exact
+    # comparison the grid scripts used so rounding at the edges cannot change the result
+    lo = np.searchsorted(sorted_grid, values - tolerance, side='left').ravel()
+    hi = np.searchsorted(sorted_grid, values + tolerance, side='right').ravel()
+    lo = np.maximum(lo - 1, 0)
+    hi = np.minimum(hi + 1, len(sorted_grid))
+    counts = np.maximum(hi - lo, 0)
+
+    samples = np.repeat(values.ravel(), counts)
+    rows = np.repeat(np.arange(values.shape[0]).repeat(values.shape[1]), counts)
+    grid_idx = order[_expand_ranges(lo, counts)]
+    grid_values = np.asarray(grid)[grid_idx]
+    close = (samples >= grid_values - tolerance) & (samples <= grid_values + tolerance)
+    rows = rows[close]
+    grid_idx = grid_idx[close]
+
+    # Drop duplicates from several samples of the same row hitting the same grid value
+    keys = np.unique(rows * len(grid) + grid_idx)
+    return keys // len(grid), keys % len(grid)
+
+
+# Function to match the track to every grid cell in one pass.
+# Returns {(grid_lat, grid_lon): sorted profile indices}, only for cells with at least one profile.
+def match_grid_points(lat, lon, grid_lats, grid_lons, lat_tolerance, lon_tolerance):
+    n_lons = len(grid_lons)
+    lat_rows, lat_idx = _axis_hits(lat, grid_lats, lat_tolerance)
+    lon_rows, lon_idx = _axis_hits(lon, grid_lons, lon_tolerance)
+
+    # Pair every latitude hit of a row with every longitude hit of the same row
+    n_rows = np.asarray(lat).shape[0]
+    lon_counts = np.bincount(lon_rows, minlength=n_rows)
+    lon_starts = np.cumsum(lon_counts) - lon_counts
+    reps = lon_counts[lat_rows]
+    pair_rows = np.repeat(lat_rows, reps)
+    pair_lat = np.repeat(lat_idx, reps)
+    pair_lon = lon_idx[_expand_ranges(lon_starts[lat_rows], reps)]
+
+    cells = pair_lat * n_lons + pair_lon
+    order = np.lexsort((pair_rows, cells))
+    cells = cells[order]
+    pair_rows = pair_rows[order]
+
+    matches = {}
+    bounds = np.flatnonzero(np.diff(cells)) + 1
+    starts = np.concatenate(([0], bounds))
+    for start, cell_rows in zip(starts, np.split(pair_rows, bounds)):
+        if len(cell_rows) == 0:
+            continue
+        i, j = divmod(int(cells[start]), n_lons)
+        matches[(grid_lats[i], grid_lons[j])] = cell_rows
+    return matches
+
+
+# Function to pick, among the candidate profiles of a grid point, the one with the highest
+# mean over its valid values. profiles and valid are (candidates, altitudes) blocks.
+# Returns (row in the block, valid values, their altitudes) or None if no profile has valid data.
+def select_best_profile(profiles, valid, altitudes):
+    counts = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sums = np.where(valid, profiles, 0).sum(axis=1, dtype=np.float64)
+        means = sums / counts
+
+    # Empty or NaN rows can never win, like in the profile by profile comparison
+    means[np.isnan(means)] = -np.inf
+    best = int(np.argmax(means))
+    if not means[best] > -np.inf:
+        return None
+
+    best_valid = valid[best]
+    return best, profiles[best][best_valid], altitudes[best_valid]
+
+# Function to set up logging in a worker process with the logging.basicConfig arguments of the script:
+# workers started with spawn (Windows) do not run the script's own basicConfig, their messages would be lost
+def _init_worker_logging(log_config):
+    if not logging.getLogger().handlers:
+        logging.basicConfig(**log_config)
+
+
+# Function to run func(file, *args) for every file, in a process pool when workers > 1.
+# Results are yielded in the order of files whatever the number of workers,
+# and an error in one file never stops the others.
+# At most 2 * workers files are in flight: the next file is only sent when a result is taken, so the results
+# do not pile up in this process when whoever uses them (e.g. the plotting) is slower than the workers.
+# log_config are the logging.basicConfig arguments the workers are set up with (None leaves them as they start).
+def run_per_file(func, files, args=(), workers=1, log_config=None):
+    if workers is None or workers <= 1:
+        for file in files:
+            try:
+                yield file, func(file, *args)
+            except Exception as e:
+                logger.error("Error processing file %s: %s", file, e)
+        return
+
+    initializer, initargs = (None, ()) if log_config is None else (_init_worker_logging, (log_config,))
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        files = iter(files)
+        in_flight = deque((file, executor.submit(func, file, *args)) for file in islice(files, 2 * workers))
+        while in_flight:
+            file, future = in_flight.popleft()
+            for next_file in islice(files, 1):
+                in_flight.append((next_file, executor.submit(func, next_file, *args)))
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error("Error processing file %s: %s", file, e)
+                continue
+            yield file, result
+
+
+def compute_angstrom_exponent(ext_coeff_532, ext_coeff_1064):
+    lambda1 = 532
+    lambda2 = 1065
+    ratio = ext_coeff_532 / ext_coeff_1064
+    angstrom_exponent = np.log(ratio) / np.log(lambda1 / lambda2)
+    return angstrom_exponent
+
+
+# Functions returning the candidate profiles of a product and the mask of their valid values
+def backscatter_profiles(datasets, indices, cap_index):
+    profiles = datasets['Total_Backscatter_Coefficient_532'][np.ix_(indices, cap_index)]
+    # Remove -9999 values
+    return profiles, profiles != -9999
+
+
+def depolarization_profiles(datasets, indices, cap_index):
+    profiles = datasets['Particulate_Depolarization_Ratio_Profile_532'][np.ix_(indices, cap_index)]
+    # Remove -9999 values and keep only positive depolarization ratios
+    return profiles, (profiles != -9999) & (profiles > 0)
+
+
+def angstrom_profiles(datasets, indices, cap_index):
+    ext_532_profiles = datasets['Extinction_Coefficient_532'][np.ix_(indices, cap_index)]
+    ext_1064_profiles = datasets['Extinction_Coefficient_1064'][np.ix_(indices, cap_index)]
+    # Remove -9999 values
+    valid = (ext_532_profiles != -9999) & (ext_1064_profiles != -9999)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profiles = compute_angstrom_exponent(ext_1064_profiles, ext_532_profiles)
+    return profiles, valid
+
+
+# Products the grid scripts can extract, with the datasets they need and how they are plotted
+PRODUCTS = {
+    'backscatter': {
+        'datasets': ['Total_Backscatter_Coefficient_532'],
+        'profiles': backscatter_profiles,
+        'title': 'Backscatter Coefficient (532 nm) profile',
+        'xlabel': 'Backscatter Coefficient (532 nm)',
+    },
+    'depolarization': {
+        'datasets': ['Particulate_Depolarization_Ratio_Profile_532'],
+        'profiles': depolarization_profiles,
+        'title': 'Depolarization Ratio (532 nm) profile',
+        'xlabel': 'Depolarization Ratio (532 nm)',
+    },
+    'angstrom': {
+        'datasets': ['Extinction_Coefficient_532', 'Extinction_Coefficient_1064'],
+        'profiles': angstrom_profiles,
+        'title': 'Ångström Exponent profile',
+        'xlabel': 'Ångström Exponent',
+    },
+}
+
+
+# Renderer of the profile plots (GridPoint_n.png) on one Agg figure that is reused for every save,
+# only the line data, labels, title and legend change between plots
+class ProfileRenderer:
+    def __init__(self):
+        self.fig = Figure(figsize=(8, 6))
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.line, = self.ax.plot([], [])
+        self.ax.set_ylabel("Altitude (km)")
+        self.ax.grid(True)
+        self.dirs = set()
+
+    def render(self, profile, altitudes, longitude, latitude, grid_lat, point_number, file, save_dir, product):
+        ax = self.ax
+        self.line.set_data(profile, altitudes)
+        self.line.set_label(f"Lat {latitude} (Point {point_number})")
+        ax.set_title(f"{PRODUCTS[product]['title']} at Lat {grid_lat} deg (Point {point_number})\nFile: {file}")
+        ax.set_xlabel(PRODUCTS[product]['xlabel'])
+        ax.relim()
+        ax.set_autoscale_on(True)
+        ax.autoscale_view()
+        ax.set_ylim(0, 10)  # Set y-axis limits to always show up to 10 km
+        ax.legend()
+
+        if save_dir not in self.dirs:
+            os.makedirs(save_dir, exist_ok=True)
+            self.dirs.add(save_dir)
+        self.fig.savefig(os.path.join(save_dir, f"GridPoint_{point_number}.png"))
+
+
+# Output file of a render job
+def _plot_path(job):
+    return os.path.join(job[7], f"GridPoint_{job[5]}.png")
+
+
+# Function to render a list of jobs with one renderer (runs in the worker processes)
+def _render_batch(jobs):
+    renderer = ProfileRenderer()
+    for job in jobs:
+        renderer.render(*job)
+    return len(jobs)
+
+
+# Function to render batches of jobs (tuples of ProfileRenderer.render arguments), given as (tag, [jobs]) with one
+# batch per granule. With workers > 1 every batch is sent to the worker processes as soon as it arrives, and only
+# waits for the earlier batches saving one of the same files, so a later job for the same output file replaces an
+# earlier one like in file order and the saved plots are the same whatever the number of workers.
+# done(tag) is called once all the plots of a batch are saved. An error while plotting a batch is logged and only
+# stops that batch (its done is not called), like an error in one granule never stops the others.
+# timer is an optional StageTimer the rendering time (time spent waiting for the workers when workers > 1)
+# and number of plots are added to.
+def render_profiles(batches, workers=1, timer=None, done=None):
+    timer = StageTimer() if timer is None else timer
+    if workers is None or workers <= 1:
+        renderer = ProfileRenderer()
+        for tag, jobs in batches:
+            try:
+                for job in jobs:
+                    with timer.stage('plotting'):
+                        renderer.render(*job)
+                    timer.count('plots')
+            except Exception as e:
+                logger.error("Error plotting file %s: %s", tag, e)
+                continue
+            if done is not None:
+                done(tag)
+        return
+
+    writers = {}  # Output file: future of the last batch saving it
+    running = {}  # Future: tag of its batch, in submission order
+
+    def collect(futures):
+        for future in futures:
+            tag = running.pop(future)
+            try:
+                timer.count('plots', future.result())
+            except Exception as e:
+                logger.error("Error plotting file %s: %s", tag, e)
+                continue
+            if done is not None:
+                done(tag)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for tag, jobs in batches:
+            latest = {}
+            for job in jobs:
+                path = _plot_path(job)
+                latest.pop(path, None)
+                latest[path] = job
+            earlier = {writers[path] for path in latest if path in writers}
+            with timer.stage('plotting'):
+                wait(earlier)
+                # Only a few batches are queued, so the profiles waiting for a worker stay few
+                while len(running) >= 2 * workers:
+                    wait(running, return_when=FIRST_COMPLETED)
+                    collect([future for future in running if future.done()])
+            collect([future for future in running if future.done()])
+            if not latest:
+                if done is not None:
+                    done(tag)
+                continue
+            future = executor.submit(_render_batch, list(latest.values()))
+            running[future] = tag
+            for path in latest:
+                writers[path] = future
+
+        with timer.stage('plotting'):
+            wait(running)
+        collect(list(running))
+
+
+# Function to read one granule once and select the best profile of every product for every grid point.
+# Returns ({product: [(profile, altitudes, lon, lat, grid_lat, point_number), ...]}, StageTimer of the file)
+def process_hdf_file(file, products, grid_lats, grid_lons, lat_tolerance, lon_tolerance, max_altitude, cache=None):
+    selected = {product: [] for product in products}
+    timer = StageTimer()
+    try:
+        granule = CalipsoGranule(file, cache)
+        try:
+            with timer.stage('hdf_read'):
+                lon = granule['Longitude']
+                lat = granule['Latitude']
+
+            # Retrieve the altitude data
+            with timer.stage('altitude_read'):
+                altitudes = granule.altitudes
+
+            # Cap altitudes at 10 km
+            cap_index = np.where(altitudes <= max_altitude)[0]
+            altitudes = altitudes[cap_index]
+
+            # Only the profiles that can be close to a grid point and the altitude bins under the cap are read
+            lat_rows = find_row_range(lat, np.min(grid_lats) - lat_tolerance, np.max(grid_lats) + lat_tolerance)
+            lon_rows = find_row_range(lon, np.min(grid_lons) - lon_tolerance, np.max(grid_lons) + lon_tolerance)
+            rows = intersect_ranges(lat_rows, lon_rows)
+            timer.count('grid_points', len(grid_lats) * len(grid_lons))
+            if rows.stop <= rows.start:
+                logger.debug("No close trajectory point for any grid point in file %s", file)
+                timer.count('files')
+                return selected, timer
+            cols = index_range(cap_index)
+            cap_index = cap_index - cols.start
+            lat = lat[rows]
+            lon = lon[rows]
+
+            # Read every dataset needed by the products only once (decoded arrays come from the cache when possible)
+            datasets = {}
+            with timer.stage('hdf_read'):
+                for product in products:
+                    for name in PRODUCTS[product]['datasets']:
+                        if name not in datasets:
+                            datasets[name] = granule.read(name, rows, cols)
+
+            logger.debug("Processing file: %s", file)
+            logger.debug("Grid latitudes: %s", grid_lats)
+            logger.debug("Grid longitudes: %s", grid_lons)
+
+            # Find the points within the tolerance of every grid point at once
+            with timer.stage('matching'):
+                matches = match_grid_points(lat, lon, grid_lats, grid_lons, lat_tolerance, lon_tolerance)
+            timer.count('matched_points', len(matches))
+
+            with timer.stage('selection'):
+                for lat_idx, grid_lat in enumerate(grid_lats, start=1):
+                    for lon_idx, grid_lon in enumerate(grid_lons, start=1):
+                        common_indices = matches.get((grid_lat, grid_lon), np.array([], dtype=int))
+
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Grid point: (%s, %s)", grid_lat, grid_lon)
+                            logger.debug("Common indices: %s", common_indices + rows.start)
+
+                        if len(common_indices) > 0:
+                            for product in products:
+                                # Keep the profile with the highest mean value
+                                profiles, valid = PRODUCTS[product]['profiles'](datasets, common_indices, cap_index)
+                                best = select_best_profile(profiles, valid, altitudes)
+
+                                if best is not None:
+                                    best_row, best_profile, best_altitudes = best
+                                    index = common_indices[best_row]
+                                    selected[product].append((best_profile, best_altitudes, lon[index], lat[index], grid_lat, lon_idx))
+                                    timer.count('profiles_selected')
+                        else:
+                            logger.debug("No close trajectory point for grid point (%s, %s) in file %s", grid_lat, grid_lon, file)
+            timer.count('files')
+        except KeyError:
+            logger.warning("Skipping file %s due to missing data.", file)
+        except Exception as e:
+            logger.error("Error processing file %s: %s", file, e)
+        finally:
+            granule.close()
+    except Exception as e:
+        logger.error("Error reading file %s: %s", file, e)
+    return selected, timer
+
+
+# Function to extract the profiles of every product in output_dirs ({product: directory}) from
+# every granule in the directory, reading each granule once.
+# cache is an optional hdf_cache.DatasetCache keeping the decoded datasets between runs.
+# The plots are rendered by render_workers processes (workers when None), in a second pool running next to the
+# one of the granules, so up to workers + render_workers processes are busy at the same time.
+# When store_path is set every selected profile is also written to a profile_store directory there.
+# The time spent in every stage is logged at the end, and saved as JSON to report_path when it is set.
+# log_config are the logging.basicConfig arguments of the script, so the granule workers log the same way.
+# When manifest_path is set the run is resumable: every finished granule is recorded in a run_manifest there,
+# with its plots and store parts, and a rerun skips the granules that did not change since with the same
+# parameters. force=True processes every granule again.
+def process_hdf_files(directory, lat_range, lon_range, lat_step, lon_step, output_dirs, workers=1, cache=None,
+                      render_workers=None, store_path=None, report_path=None, manifest_path=None, force=False,
+                      log_config=None):
+    start = time.perf_counter()
+    files = sorted(glob.glob(f"{directory}/*.hdf"))
+    products = list(output_dirs)
+    render_workers = workers if render_workers is None else render_workers
+
+    lat_tolerance = 1  # Latitude tolerance
+    lon_tolerance = 1  # Longitude tolerance
+    max_altitude = 10.0  # Maximum altitude in km
+
+    # Create grid points
+    grid_lats, grid_lons = make_grid(lat_range, lon_range, lat_step, lon_step)
+
+    # Granules already processed with the same parameters, and the granule (position in files) each of their
+    # plots is from: an earlier granule processed again must not replace them
+    manifest = None
+    done = set()
+    owners = {}
+    if manifest_path is not None:
+        params = {'lat_range': lat_range, 'lon_range': lon_range, 'lat_step': lat_step, 'lon_step': lon_step,
+                  'output_dirs': output_dirs, 'lat_tolerance': lat_tolerance, 'lon_tolerance': lon_tolerance,
+                  'max_altitude': max_altitude, 'store_path': store_path}
+        manifest = RunManifest(manifest_path, params, force)
+        done = {file for file in files if manifest.is_done(file)}
+        for position, file in enumerate(files):
+            if file in done:
+                for output in manifest.outputs(file):
+                    owners[output] = position
+        logger.info("Skipping %d of %d files already processed (manifest %s)", len(done), len(files), manifest_path)
+    positions = {file: position for position, file in enumerate(files)}
+    pending = [file for file in files if file not in done]
+
+    # Granules are processed in parallel, plots are saved in file order so the output
+    # does not depend on the number of workers
+    args = (products, grid_lats, grid_lons, lat_tolerance, lon_tolerance, max_altitude, cache)
+    timer = StageTimer()
+    timer.count('files_skipped', len(done))
+    store = None
+    if store_path is not None:
+        kept_parts = [output for output in owners if output.endswith('.npz')]
+        store = ProfileStoreWriter(store_path, keep=kept_parts)
+    finished = {}  # Outputs of the processed granules, recorded in the manifest once their plots are saved
+
+    def plot_batches():
+        for file, (selected, file_timer) in run_per_file(process_hdf_file, pending, args, workers, log_config):
+            timer.merge(file_timer)
+            logger.info("Processed file %s: %d profiles selected", file, sum(len(selected[product]) for product in products))
+            jobs = []
+            outputs = []
+            for product in products:
+                for best_profile, best_altitudes, best_lon, best_lat, grid_lat, lon_idx in selected[product]:
+                    if store is not None:
+                        store.add(file, product, grid_lat, grid_lons[lon_idx - 1], lon_idx, best_lat, best_lon, best_profile, best_altitudes)
+                    save_dir = os.path.join(output_dirs[product], f"{int(grid_lat)}")
+                    path = os.path.join(save_dir, f"GridPoint_{lon_idx}.png")
+                    if owners.get(path, -1) > positions[file]:
+                        continue
+                    outputs.append(path)
+                    logger.debug("Saving best profile for point: (%s, %s) in file %s to directory %s", best_lat, best_lon, file, save_dir)
+                    jobs.append((best_profile, best_altitudes, best_lon, best_lat, grid_lat, lon_idx, file, save_dir, product))
+
+            if manifest is not None:
+                # Every granule gets its own store parts, so they can be kept when it is not processed again
+                if store is not None:
+                    written = len(store.written)
+                    store.flush()
+                    outputs += store.written[written:]
+                # Files that failed are left out of the manifest so they are tried again
+                if file_timer.counters.get('files'):
+                    finished[file] = outputs
+            yield file, jobs
+
+    def record(file):
+        if file in finished:
+            manifest.record(file, finished.pop(file))
+
+    try:
+        render_profiles(plot_batches(), render_workers, timer, record)
+    finally:
+        if store is not None:
+            store.close()
+
+    total = time.perf_counter() - start
+    logger.info("Finished %d files in %.1f s\n%s", len(files), total, timer.report())
+    if report_path is not None:
+        timer.save_json(report_path, directory=directory, files=len(files), workers=workers, total_seconds=round(total, 6))
+
+
+# Function to plot the profiles of a profile store again, without reading the granules.
+# output_dirs is {product: directory}, products missing from it are skipped.
+def replot_from_store(store_path, output_dirs, workers=1):
+    store = ProfileStore(store_path)
+    index = store.index[store.index['product'].isin(list(output_dirs))]
+
+    # One batch per granule, the index is in granule order
+    def plot_batches():
+        jobs = []
+        for row, values, altitudes in store.profiles(index):
+            if jobs and row['granule'] != jobs[-1][6]:
+                yield jobs[-1][6], jobs
+                jobs = []
+            save_dir = os.path.join(output_dirs[row['product']], f"{int(row['grid_lat'])}")
+            jobs.append((values, altitudes, row['lon'], row['lat'], row['grid_lat'], row['point_number'], row['granule'],
+                         save_dir, row['product']))
+        if jobs:
+            yield jobs[-1][6], jobs
+
+    render_profiles(plot_batches(), workers)
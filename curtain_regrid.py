@@ -0,0 +1,43 @@
+import numpy as np
+
+
+# Function to interpolate every profile of a curtain onto the heights h.
+# values is (profiles, altitude bins) on the fixed altitude grid of the granule, so linear
+# interpolation over the (profile, altitude) points reduces to a vertical interpolation per profile.
+# Returns (len(h), profiles) like griddata(method='linear') evaluated at every profile,
+# heights outside the altitude range are NaN.
+def regrid_columns(values, altitude, h):
+    altitude = np.asarray(altitude, dtype=np.float64)
+    order = np.argsort(altitude)
+    altitude = altitude[order]
+    values = values[:, order]
+
+    # The bins around every height are the same for all profiles, so find them once
+    k = np.clip(np.searchsorted(altitude, h, side='right') - 1, 0, len(altitude) - 2)
+    w = (h - altitude[k]) / (altitude[k + 1] - altitude[k])
+
+    data = values[:, k] * (1 - w) + values[:, k + 1] * w
+    data[:, (h < altitude[0]) | (h > altitude[-1])] = np.nan
+    return data.T
+
+
+# Function to regrid a curtain along track, chunk_rows records at a time.
+# read_rows(start, stop) returns the (profiles, altitude bins) values of records start to stop of the granule,
+# keep are the (increasing) record numbers of the profiles in the curtain. Every chunk is read, regridded with
+# regrid_columns and written into the curtain, so apart from the (len(h), len(keep)) result memory is bounded
+# by the chunk size, not by the granule. The curtain is float32 (dtype), like the backscatter it is made from.
+def stream_regrid_columns(read_rows, keep, altitude, h, chunk_rows=2000, dtype=np.float32):
+    keep = np.asarray(keep)
+    data = np.empty((len(h), len(keep)), dtype=dtype)
+    if len(keep) == 0:
+        return data
+    column = 0
+    for start in range(int(keep[0]), int(keep[-1]) + 1, chunk_rows):
+        stop = min(start + chunk_rows, int(keep[-1]) + 1)
+        chunk_keep = keep[column:column + np.searchsorted(keep[column:], stop)]
+        if len(chunk_keep) == 0:
+            continue
+        values = read_rows(start, stop)[chunk_keep - start]
+        data[:, column:column + len(chunk_keep)] = regrid_columns(values, altitude, h)
+        column += len(chunk_keep)
+    return data
@@ -3,9 +3,10 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
-from pyhdf.SD import SD, SDC
+from calipso_granule import CalipsoGranule
 import glob
 import re
+from fire_data import load_fire_data, select_dates
 
 # Function to generate grid points
 def generate_grid(lon_min, lon_max, lat_min, lat_max, step):
@@ -15,23 +16,71 @@ def generate_grid(lon_min, lon_max, lat_min, lat_max, step):
 
 # Function to load and process CALIPSO data from HDF files
 def load_hdf_data(file_path):
-    hdf_file = SD(file_path, SDC.READ)
-    lat = hdf_file.select('Latitude')
-    lon = hdf_file.select('Longitude')
-    lat_data = lat[:].flatten()
-    lon_data = lon[:].flatten()
-    hdf_file.end()
+    with CalipsoGranule(file_path) as granule:
+        lat_data = granule['Latitude'].flatten()
+        lon_data = granule['Longitude'].flatten()
     return pd.DataFrame({'latitude': lat_data, 'longitude': lon_data})
 
+# Function to simplify a track with Douglas-Peucker: the kept points are such that no dropped point
+# is further than tolerance (degrees) from the line between its kept neighbours
+def douglas_peucker(lon, lat, tolerance):
+    n = len(lon)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = lon[end] - lon[start], lat[end] - lat[start]
+        px, py = lon[start + 1:end] - lon[start], lat[start + 1:end] - lat[start]
+        length = np.hypot(dx, dy)
+        if length > 0:
+            distance = np.abs(dx * py - dy * px) / length
+        else:
+            distance = np.hypot(px, py)
+        index = np.argmax(distance)
+        if distance[index] > tolerance:
+            index += start + 1
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+# Function to decimate a track before plotting. method is 'douglas_peucker' (tolerance in degrees),
+# 'stride' (every stride-th point) or None to keep every point. The first and last points are always kept.
+def simplify_track(df, method='douglas_peucker', tolerance=0.01, stride=50):
+    if method is None or len(df) < 3:
+        return df
+    if method == 'stride':
+        index = np.unique(np.append(np.arange(0, len(df), stride), len(df) - 1))
+    elif method == 'douglas_peucker':
+        index = douglas_peucker(df['longitude'].to_numpy(dtype=float), df['latitude'].to_numpy(dtype=float), tolerance)
+    else:
+        raise ValueError(f"Unknown track simplification: {method}")
+    return df.iloc[index]
+
+# Function to find the orbit class of a granule, its colour and legend label
+def orbit_class(file_path):
+    if re.search(r'\d+_2_L1', file_path):
+        return 'green', 'Trajectories (_2_L1)'
+    elif re.search(r'\d+_1_L1', file_path):
+        return 'blue', 'Trajectories (_1_L1)'
+    return 'gray', 'Trajectories (other)'
+
 # Load fire data from CSV
 file_path = 'D:\\Diploma\\modis_2023_Canada.csv'
-data = pd.read_csv(file_path)
-data['acq_date'] = pd.to_datetime(data['acq_date'])
+data = load_fire_data(file_path, columns=['latitude', 'longitude', 'acq_date'])
 start_date = '2023-05-15'
 end_date = '2023-05-25'
-filtered_data = data[(data['acq_date'] >= start_date) & (data['acq_date'] <= end_date)]
+filtered_data = select_dates(data, start_date, end_date)
 specific_date = '2023-05-19'
-fires_on_specific_date = filtered_data[filtered_data['acq_date'] == specific_date]
+fires_on_specific_date = select_dates(filtered_data, specific_date)
+
+# Track simplification before plotting: 'douglas_peucker', 'stride' or None for every point
+track_method = 'douglas_peucker'
+track_tolerance = 0.01  # degrees, for douglas_peucker
+track_stride = 50  # for stride
 
 # Configuration for grid
 lon_min, lon_max = -120, 8
@@ -61,15 +110,17 @@ ax.scatter(fires_on_specific_date['longitude'], fires_on_specific_date['latitude
 # Load and plot CALIPSO trajectories
 directory_path = 'D:/CALIPSO/L1 SMOKE'
 file_paths = glob.glob(f"{directory_path}/*.hdf")
+class_lines = {}  # One legend entry per orbit class: label -> [first line, number of files]
 for file_path in file_paths:
-    df = load_hdf_data(file_path)
-    if re.search(r'\d+_2_L1', file_path):
-        color = 'green'
-    elif re.search(r'\d+_1_L1', file_path):
-        color = 'blue'
+    df = simplify_track(load_hdf_data(file_path), track_method, track_tolerance, track_stride)
+    color, label = orbit_class(file_path)
+    line, = ax.plot(df['longitude'], df['latitude'], color=color, linewidth=1, transform=ccrs.PlateCarree(), label='_nolegend_')
+    if label in class_lines:
+        class_lines[label][1] += 1
     else:
-        color = 'gray'
-    ax.plot(df['longitude'], df['latitude'], color=color, linewidth=1, transform=ccrs.PlateCarree(), label=f'Trajectory ({file_path})')
+        class_lines[label] = [line, 1]
+for label, (line, count) in class_lines.items():
+    line.set_label(f'{label}, {count} files')
 
 # Adding coastlines and borders for better visual context
 ax.coastlines()
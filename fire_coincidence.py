@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from calipso_granule import CalipsoGranule
+from fire_data import select_dates
+
+EARTH_RADIUS = 6371.0  # km
+
+COINCIDENCE_COLUMNS = ['profile_index', 'latitude', 'longitude', 'profile_time', 'fire_count',
+                       'nearest_distance_km', 'frp_sum', 'brightness_sum']
+
+
+# Function to convert Profile_UTC_Time (yymmdd.fraction of the day) to datetimes
+def calipso_times(utc):
+    utc = np.asarray(utc, dtype=np.float64)
+    day = np.floor(utc).astype(np.int64)
+    dates = pd.to_datetime(pd.Series(day + 20000000).astype(str), format='%Y%m%d').to_numpy()
+    return dates + ((utc - day) * 86400000).round().astype('timedelta64[ms]')
+
+
+# Function to get the detection time of every fire (acq_date plus acq_time as HHMM UTC)
+def fire_times(fires):
+    times = fires['acq_date'].to_numpy().astype('datetime64[ms]')
+    if 'acq_time' in fires:
+        acq_time = fires['acq_time'].to_numpy().astype(np.int64)
+        times = times + ((acq_time // 100) * 60 + acq_time % 100).astype('timedelta64[m]')
+    return times
+
+
+# Function to calculate the great-circle distance in km
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# Function to put points on the unit sphere, so a ball of chord length is a great-circle distance
+def _unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+# Function to read the track of a L1 or L2 granule: latitude, longitude and time of every profile.
+# L2 files have three values per profile (start, centre, end), the centre is used.
+def read_track(file, cache=None):
+    track = []
+    with CalipsoGranule(file, cache) as granule:
+        for name in ('Latitude', 'Longitude', 'Profile_UTC_Time'):
+            data = np.reshape(granule[name], (len(granule[name]), -1))
+            track.append(data[:, data.shape[1] // 2])
+    return track[0], track[1], calipso_times(track[2])
+
+
+# Function to find the fires within max_distance km (and time_window hours, None for any time) of every profile.
+# fires is the MODIS data sorted by acq_date (see fire_data.load_fire_data).
+# The fires of the granule days are put in a KD-tree on the unit sphere and every profile asks it for the
+# fires inside its ball, so the work grows with the number of profiles and matches, not profiles x fires.
+# Returns one row per profile with at least one fire.
+def find_coincidences(lat, lon, times, fires, max_distance=50, time_window=None):
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if time_window is not None and len(times) > 0:
+        window = np.timedelta64(int(time_window * 3600), 's')
+        first_day = (times.min() - window).astype('datetime64[D]')
+        last_day = (times.max() + window).astype('datetime64[D]')
+        fires = select_dates(fires, first_day, last_day)
+    if len(fires) == 0 or len(lat) == 0:
+        return pd.DataFrame(columns=COINCIDENCE_COLUMNS)
+
+    fire_lat = fires['latitude'].to_numpy(dtype=np.float64)
+    fire_lon = fires['longitude'].to_numpy(dtype=np.float64)
+    tree = cKDTree(_unit_vectors(fire_lat, fire_lon))
+    chord = 2 * np.sin(min(max_distance / EARTH_RADIUS, np.pi) / 2)
+    neighbours = tree.query_ball_point(_unit_vectors(lat, lon), chord)
+
+    # Flatten the matches into (profile, fire) pairs, grouped by profile
+    counts = np.array([len(n) for n in neighbours])
+    profile = np.repeat(np.arange(len(lat)), counts)
+    fire = np.concatenate(neighbours).astype(np.int64) if counts.sum() else np.zeros(0, dtype=np.int64)
+
+    distance = haversine(lat[profile], lon[profile], fire_lat[fire], fire_lon[fire])
+    keep = distance <= max_distance
+    if time_window is not None:
+        keep &= np.abs(fire_times(fires)[fire] - times[profile]) <= window
+    profile, fire, distance = profile[keep], fire[keep], distance[keep]
+    if len(profile) == 0:
+        return pd.DataFrame(columns=COINCIDENCE_COLUMNS)
+
+    # Reduce the pairs of every profile in one pass
+    rows, starts = np.unique(profile, return_index=True)
+    def summed(column):
+        if column not in fires:
+            return np.full(len(rows), np.nan)
+        return np.add.reduceat(fires[column].to_numpy(dtype=np.float64)[fire], starts)
+
+    return pd.DataFrame({
+        'profile_index': rows,
+        'latitude': lat[rows],
+        'longitude': lon[rows],
+        'profile_time': times[rows],
+        'fire_count': np.diff(np.append(starts, len(profile))),
+        'nearest_distance_km': np.minimum.reduceat(distance, starts),
+        'frp_sum': summed('frp'),
+        'brightness_sum': summed('brightness'),
+    })
@@ -0,0 +1,100 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Compact types of the MODIS active fire CSV columns, other columns keep the pandas default
+MODIS_DTYPES = {
+    'latitude': 'float32',
+    'longitude': 'float32',
+    'brightness': 'float32',
+    'scan': 'float32',
+    'track': 'float32',
+    'acq_time': 'int16',
+    'satellite': 'category',
+    'instrument': 'category',
+    'confidence': 'uint8',
+    'version': 'category',
+    'bright_t31': 'float32',
+    'frp': 'float32',
+    'daynight': 'category',
+    'type': 'uint8',
+}
+
+
+# Function to read the MODIS CSV with explicit types, sorted by acq_date.
+# Only columns (plus acq_date) are parsed, or every column when it is None.
+def read_fire_csv(csv_path, columns=None):
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = list(header) if columns is None else [column for column in header if column in columns or column == 'acq_date']
+    dtypes = {column: dtype for column, dtype in MODIS_DTYPES.items() if column in usecols}
+    data = pd.read_csv(csv_path, usecols=usecols, dtype=dtypes, parse_dates=['acq_date'])
+    data = data.sort_values('acq_date', kind='stable', ignore_index=True)
+    return data
+
+
+# Function to get the columns of the Parquet copy if it was made from the current CSV (same size and
+# modification time), None otherwise
+def _cached_columns(cache_path, csv_path):
+    if not os.path.exists(cache_path):
+        return None
+    import pyarrow.parquet as pq
+    schema = pq.read_schema(cache_path)
+    metadata = schema.metadata or {}
+    stat = os.stat(csv_path)
+    if (metadata.get(b'source_size') != str(stat.st_size).encode()
+            or metadata.get(b'source_mtime_ns') != str(stat.st_mtime_ns).encode()):
+        return None
+    return schema.names
+
+
+# Function to write the Parquet copy, tagged with the size and modification time of the CSV
+def _write_cache(data, cache_path, csv_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    stat = os.stat(csv_path)
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'source_size'] = str(stat.st_size).encode()
+    metadata[b'source_mtime_ns'] = str(stat.st_mtime_ns).encode()
+    tmp_path = cache_path + '.tmp'
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+# Function to load the MODIS fire data, only columns (every column when None).
+# The first load parses these columns of the CSV and stores a Parquet copy next to it (or at cache_path),
+# later loads read the copy as long as the CSV is unchanged and the copy has the columns. A load asking
+# for other columns parses them with the ones already in the copy, so the copy grows to what the scripts use.
+# Without pyarrow the CSV is parsed every time.
+# The rows are sorted by acq_date, so select_dates can find a date range with a binary search.
+def load_fire_data(csv_path, columns=None, cache_path=None):
+    if cache_path is None:
+        cache_path = os.path.splitext(csv_path)[0] + '.parquet'
+    wanted = list(pd.read_csv(csv_path, nrows=0).columns) if columns is None else list(columns)
+
+    cached = None
+    try:
+        cached = _cached_columns(cache_path, csv_path)
+        if cached is not None and set(wanted) <= set(cached):
+            return pd.read_parquet(cache_path, columns=columns)
+    except ImportError:
+        data = read_fire_csv(csv_path, columns)
+        return data[columns] if columns is not None else data
+    except Exception as e:
+        print(f"Error reading cache {cache_path}: {e}")
+
+    data = read_fire_csv(csv_path, wanted + [column for column in cached or [] if column not in wanted])
+    try:
+        _write_cache(data, cache_path, csv_path)
+    except Exception as e:
+        print(f"Error writing cache {cache_path}: {e}")
+    return data[columns] if columns is not None else data
+
+
+# Function to select the rows between two dates (both included) of data sorted by acq_date.
+# Without an end date only the rows of the start date are selected.
+def select_dates(data, start_date, end_date=None):
+    dates = data['acq_date'].to_numpy()
+    start = np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+    stop = np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date or start_date)), side='right')
+    return data.iloc[start:stop]
@@ -0,0 +1,110 @@
+import json
+import numpy as np
+import pandas as pd
+import folium
+from branca.element import MacroElement, Template
+from folium.plugins import FastMarkerCluster, HeatMap
+
+
+# Function to calculate radius based on brightness
+def calculate_radius(brightness):
+    return (brightness - 300) / 10  # Adjust the divisor to control circle sizes
+
+
+# Function to calculate the marker radius of every detection at once (the minimum radius is 1)
+def marker_radius(brightness):
+    return np.maximum(calculate_radius(np.asarray(brightness, dtype=float)), 1)
+
+
+# Function to turn a column into JSON friendly values
+def _column_values(column):
+    column = pd.Series(column)
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        return column.dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
+    if isinstance(column.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(column.dtype):
+        return column.astype(str).tolist()
+    if column.dtype == np.float32:
+        # Shortest text of the float32 value, so 374.4 is not shown as 374.3999938964844
+        return np.asarray(column).astype(str).astype(float).tolist()
+    return np.asarray(column).tolist()
+
+
+# All the detections of a layer as one JSON block drawn on a canvas by a single loop in the browser.
+# Popups are only built when a marker is clicked.
+class CanvasCircleLayer(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var data = {{ this.data }};
+            var labels = {{ this.labels }};
+            var renderer = L.canvas();
+            var group = L.featureGroup();
+            for (var i = 0; i < data.lat.length; i++) {
+                var marker = L.circleMarker([data.lat[i], data.lon[i]], {
+                    renderer: renderer, radius: data.radius[i], color: {{ this.color }},
+                    fill: true, fillColor: {{ this.color }}
+                });
+                marker.index = i;
+                marker.bindPopup(function(layer) {
+                    return labels.map(function(label, j) {
+                        return label + ': ' + data.popup[j][layer.index];
+                    }).join('<br>');
+                });
+                group.addLayer(marker);
+            }
+            return group;
+        })().addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, lat, lon, radius, color, popup_columns):
+        super().__init__()
+        self._name = 'CanvasCircleLayer'
+        self.data = json.dumps({
+            'lat': _column_values(lat),
+            'lon': _column_values(lon),
+            'radius': np.round(radius, 3).tolist(),
+            'popup': [_column_values(column) for column in popup_columns.values()],
+        })
+        self.labels = json.dumps(list(popup_columns))
+        self.color = json.dumps(color)
+
+
+# Function to add fire detections to the map without creating one Python object per detection.
+# mode is 'canvas' (one canvas layer with the same circles as before), 'cluster' (clustered markers),
+# 'heatmap' (heatmap weighted by the marker radius) or 'markers' (one folium.CircleMarker per detection).
+# popup_fields maps the popup labels to the columns of fires.
+def add_fire_layer(m, fires, color='red', mode='canvas', popup_fields=None):
+    if popup_fields is None:
+        popup_fields = {'Brightness': 'brightness', 'Acquisition Date': 'acq_date'}
+    radius = marker_radius(fires['brightness'])
+
+    if mode == 'canvas':
+        popup_columns = {label: fires[column] for label, column in popup_fields.items()}
+        CanvasCircleLayer(fires['latitude'], fires['longitude'], radius, color, popup_columns).add_to(m)
+    elif mode == 'cluster':
+        callback = """
+            function (row) {
+                return L.circleMarker(new L.LatLng(row[0], row[1]), {
+                    radius: row[2], color: %s, fill: true, fillColor: %s
+                });
+            }""" % (json.dumps(color), json.dumps(color))
+        data = np.column_stack([fires['latitude'], fires['longitude'], radius]).tolist()
+        FastMarkerCluster(data, callback=callback).add_to(m)
+    elif mode == 'heatmap':
+        weight = radius / radius.max() if len(radius) else radius
+        data = np.column_stack([fires['latitude'], fires['longitude'], weight]).tolist()
+        HeatMap(data, radius=10, blur=8).add_to(m)
+    elif mode == 'markers':
+        popup_columns = [(label, _column_values(fires[column])) for label, column in popup_fields.items()]
+        for i, (lat, lon) in enumerate(zip(fires['latitude'], fires['longitude'])):
+            folium.CircleMarker(
+                location=[lat, lon],
+                radius=radius[i],
+                popup='<br>'.join(f'{label}: {values[i]}' for label, values in popup_columns),
+                color=color,
+                fill=True,
+                fill_color=color
+            ).add_to(m)
+    else:
+        raise ValueError(f"Unknown fire layer mode: {mode}")
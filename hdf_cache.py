@@ -0,0 +1,64 @@
+import os
+import hashlib
+import numpy as np
+
+
+# On-disk cache of decoded HDF datasets.
+# Every array is stored as a .npy file keyed by the granule path, its mtime and size, and the
+# dataset name, so a changed granule is never served from the cache. Cached arrays are memory
+# mapped copy-on-write: reading them costs almost nothing and writing to them never touches the cache.
+# When the cache grows past max_size_gb the least recently used arrays are deleted.
+class DatasetCache:
+    def __init__(self, cache_dir, max_size_gb=20):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_size_gb * 1024 ** 3)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, file, name):
+        stat = os.stat(file)
+        key = f"{os.path.abspath(file)}|{stat.st_mtime_ns}|{stat.st_size}|{name}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npy')
+
+    # Function to return the cached array, or decode it with read() and store it
+    def load(self, file, name, read):
+        path = self._path(file, name)
+        try:
+            data = np.load(path, mmap_mode='c')
+            os.utime(path)  # Mark as recently used
+            return data
+        except (OSError, ValueError):
+            pass
+
+        data = np.asarray(read())
+        # Write to a temporary file first so parallel workers never see a partial array
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+        self.evict()
+        return data
+
+    # Function to delete the least recently used arrays until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass  # Still open in another process, try again next time
+
+
+# Function to read a dataset through the cache when there is one
+def load_dataset(cache, file, name, read):
+    if cache is None:
+        return read()
+    return cache.load(file, name, read)
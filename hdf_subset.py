@@ -0,0 +1,48 @@
+import numpy as np
+
+
+# Function to find the rows of the along-track range where low <= values <= high.
+# values is a geolocation array (n,) or (n, k); a row is kept when any of its samples can be in range.
+# Returns a slice covering every matching row, so only that slab of the big datasets has to be read.
+# Callers still apply their own filters to the rows inside the slab.
+def find_row_range(values, low, high):
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    row_min = values.min(axis=1)
+    row_max = values.max(axis=1)
+
+    # Latitude (and longitude within a half orbit) is monotonic, so a binary search is enough
+    if np.all(np.diff(row_min) >= 0) and np.all(np.diff(row_max) >= 0):
+        start = np.searchsorted(row_max, low, side='left')
+        stop = np.searchsorted(row_min, high, side='right')
+        return slice(int(start), int(max(stop, start)))
+    if np.all(np.diff(row_min) <= 0) and np.all(np.diff(row_max) <= 0):
+        n = len(row_min)
+        start = n - np.searchsorted(row_min[::-1], high, side='right')
+        stop = n - np.searchsorted(row_max[::-1], low, side='left')
+        return slice(int(start), int(max(stop, start)))
+
+    # Otherwise (e.g. the track turns around near a pole) fall back to a full scan
+    rows = np.flatnonzero((row_max >= low) & (row_min <= high))
+    if len(rows) == 0:
+        return slice(0, 0)
+    return slice(int(rows[0]), int(rows[-1]) + 1)
+
+
+# Function to find the rows in both ranges
+def intersect_ranges(a, b):
+    start = max(a.start, b.start)
+    return slice(start, max(min(a.stop, b.stop), start))
+
+
+# Function to find the slice of bins covering every index in indices (e.g. the altitude bins under a cap)
+def index_range(indices):
+    if len(indices) == 0:
+        return slice(0, 0)
+    return slice(int(indices[0]), int(indices[-1]) + 1)
+
+
+# Name a slab is stored under in the dataset cache
+def slab_name(name, rows, cols=slice(None)):
+    return f"{name}[{rows.start}:{rows.stop},{cols.start}:{cols.stop}]"
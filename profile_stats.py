@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+from calipso_grid import PRODUCTS, run_per_file
+from calipso_granule import CalipsoGranule
+from profile_store import ProfileStore
+from vfm_decode import decode_vfm
+
+# Names of the aerosol subtypes, None is used when the subtype is not known (profiles of a profile store)
+AEROSOL_SUBTYPES = {
+    None: 'All',
+    0: 'Not aerosol',
+    1: 'Clean Marine',
+    2: 'Dust',
+    3: 'Polluted Continental',
+    4: 'Clean Continental',
+    5: 'Polluted Dust',
+    6: 'Smoke',
+    7: 'Other',
+}
+
+# Default altitude bins (km) and value bins of the histograms the quantiles are taken from
+ALTITUDE_EDGES = np.round(np.arange(0, 10.01, 0.25), 2)
+VALUE_EDGES = {
+    'backscatter': np.concatenate(([0], np.logspace(-6, 0, 241))),
+    'depolarization': np.linspace(0, 1, 201),
+    'angstrom': np.linspace(-3, 5, 321),
+}
+
+
+# Running statistics of values per altitude bin, kept separately for every group key
+# (e.g. (grid latitude band, aerosol subtype)). Count, mean and the sum of squared deviations are updated
+# with Welford/Chan batch updates, quantiles come from a fixed histogram of the values, so the memory only
+# depends on the number of groups and bins. Accumulators of different workers are combined with merge.
+class AltitudeStats:
+    def __init__(self, altitude_edges=ALTITUDE_EDGES, value_edges=VALUE_EDGES['backscatter']):
+        self.altitude_edges = np.asarray(altitude_edges, dtype=np.float64)
+        self.value_edges = np.asarray(value_edges, dtype=np.float64)
+        self.groups = {}
+
+    def _group(self, key):
+        if key not in self.groups:
+            n_bins = len(self.altitude_edges) - 1
+            self.groups[key] = {
+                'count': np.zeros(n_bins, dtype=np.int64),
+                'mean': np.zeros(n_bins),
+                'm2': np.zeros(n_bins),
+                'hist': np.zeros((n_bins, len(self.value_edges) + 1), dtype=np.int64),
+            }
+        return self.groups[key]
+
+    # Function to combine the (count, mean, m2) of a batch with the ones of a group (Chan et al.)
+    @staticmethod
+    def _combine(group, count, mean, m2, hist):
+        total = group['count'] + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - group['mean']
+            group['mean'] = np.where(total > 0, group['mean'] + delta * count / total, 0)
+            group['m2'] = np.where(total > 0, group['m2'] + m2 + delta ** 2 * group['count'] * count / total, 0)
+        group['count'] = total
+        group['hist'] += hist
+
+    # Function to add values measured at altitudes (same shape) to the group key.
+    # Non finite values and altitudes outside the bins are ignored.
+    def add(self, values, altitudes, key):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        altitudes = np.asarray(altitudes, dtype=np.float64).ravel()
+        n_bins = len(self.altitude_edges) - 1
+        bins = np.searchsorted(self.altitude_edges, altitudes, side='right') - 1
+        keep = np.isfinite(values) & (bins >= 0) & (bins < n_bins)
+        values = values[keep]
+        bins = bins[keep]
+        if len(values) == 0:
+            return
+
+        count = np.bincount(bins, minlength=n_bins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(bins, weights=values, minlength=n_bins) / count
+        mean[count == 0] = 0
+        m2 = np.bincount(bins, weights=(values - mean[bins]) ** 2, minlength=n_bins)
+
+        n_values = len(self.value_edges) + 1
+        value_bins = np.searchsorted(self.value_edges, values, side='right')
+        hist = np.bincount(bins * n_values + value_bins, minlength=n_bins * n_values).reshape(n_bins, n_values)
+        self._combine(self._group(key), count, mean, m2, hist)
+
+    # Function to add the statistics of another accumulator with the same bins
+    def merge(self, other):
+        if not (np.array_equal(self.altitude_edges, other.altitude_edges) and np.array_equal(self.value_edges, other.value_edges)):
+            raise ValueError("Cannot merge statistics with different bins")
+        for key, group in other.groups.items():
+            self._combine(self._group(key), group['count'], group['mean'], group['m2'], group['hist'])
+        return self
+
+    # Function to estimate the quantiles q of every altitude bin of a group from its histogram
+    def quantiles(self, key, q):
+        hist = self.groups[key]['hist']
+        edges = self.value_edges
+        cumulative = np.cumsum(hist, axis=1)
+        result = np.full((hist.shape[0], len(q)), np.nan)
+        for b in range(hist.shape[0]):
+            total = cumulative[b, -1]
+            if total == 0:
+                continue
+            for j, quantile in enumerate(q):
+                target = quantile * total
+                k = int(np.searchsorted(cumulative[b], target, side='left'))
+                if k == 0:
+                    result[b, j] = edges[0]
+                elif k >= len(edges):
+                    result[b, j] = edges[-1]
+                else:
+                    # Linear interpolation inside the value bin [edges[k - 1], edges[k])
+                    fraction = (target - cumulative[b, k - 1]) / hist[b, k]
+                    result[b, j] = edges[k - 1] + fraction * (edges[k] - edges[k - 1])
+        return result
+
+    # Function to get a table with one row per group and altitude bin that has values
+    def summary(self, q=(0.1, 0.5, 0.9)):
+        frames = []
+        for key in sorted(self.groups, key=lambda key: tuple((k is None, k) for k in key)):
+            group = self.groups[key]
+            band, subtype = key
+            with np.errstate(invalid='ignore', divide='ignore'):
+                variance = np.where(group['count'] > 1, group['m2'] / (group['count'] - 1), np.nan)
+            frame = pd.DataFrame({
+                'Latitude_Band': band,
+                'Subtype': AEROSOL_SUBTYPES.get(subtype, subtype),
+                'Altitude_Bottom': self.altitude_edges[:-1],
+                'Altitude_Top': self.altitude_edges[1:],
+                'Count': group['count'],
+                'Mean': np.where(group['count'] > 0, group['mean'], np.nan),
+                'Variance': variance,
+                'Std': np.sqrt(variance),
+            })
+            for quantile, values in zip(q, self.quantiles(key, q).T):
+                frame[f'Q{int(round(quantile * 100))}'] = values
+            frames.append(frame[frame['Count'] > 0])
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+# Function to accumulate the profiles of a profile store, one grid latitude band per group.
+# The store is read part by part, the subtype of these profiles is not known.
+def stats_from_store(store_path, product, altitude_edges=ALTITUDE_EDGES, value_edges=None):
+    stats = AltitudeStats(altitude_edges, VALUE_EDGES[product] if value_edges is None else value_edges)
+    store = ProfileStore(store_path)
+    index = store.index[store.index['product'] == product]
+    for row, values, altitudes in store.profiles(index):
+        stats.add(values, altitudes, (float(row['grid_lat']), None))
+    return stats
+
+
+# Function to accumulate every profile of a L2 PRO granule, grouped by latitude band (the nearest
+# multiple of lat_step, like the grid points) and by the aerosol subtype of every altitude bin
+# (from Atmospheric_Volume_Description, None if the granule does not have it).
+def granule_stats(file, product, lat_step=2, altitude_edges=ALTITUDE_EDGES, value_edges=None, cache=None):
+    stats = AltitudeStats(altitude_edges, VALUE_EDGES[product] if value_edges is None else value_edges)
+    with CalipsoGranule(file, cache) as granule:
+        lat = granule['Latitude']
+        altitudes = granule.altitudes
+        cap_index = np.flatnonzero((altitudes >= altitude_edges[0]) & (altitudes <= altitude_edges[-1]))
+        altitudes = altitudes[cap_index]
+
+        datasets = {name: granule[name] for name in PRODUCTS[product]['datasets']}
+        if 'Atmospheric_Volume_Description' in granule:
+            description = granule['Atmospheric_Volume_Description']
+            subtypes = decode_vfm(description[:, cap_index, 0], ['aerosol_subtype'])['aerosol_subtype']
+        else:
+            subtypes = None
+
+    lat = np.reshape(lat, (len(lat), -1))
+    bands = lat_step * np.round(lat[:, lat.shape[1] // 2] / lat_step)
+    profiles, valid = PRODUCTS[product]['profiles'](datasets, np.arange(len(lat)), cap_index)
+    altitude_grid = np.broadcast_to(altitudes, profiles.shape)
+
+    for band in np.unique(bands):
+        rows = bands == band
+        band_valid = valid[rows]
+        if subtypes is None:
+            stats.add(profiles[rows][band_valid], altitude_grid[rows][band_valid], (float(band), None))
+            continue
+        band_subtypes = subtypes[rows]
+        for subtype in np.unique(band_subtypes[band_valid]):
+            mask = band_valid & (band_subtypes == subtype)
+            stats.add(profiles[rows][mask], altitude_grid[rows][mask], (float(band), int(subtype)))
+    return stats
+
+
+# Function to accumulate many granules, in worker processes when workers > 1, merging their statistics
+def granules_stats(files, product, lat_step=2, altitude_edges=ALTITUDE_EDGES, value_edges=None, workers=1, cache=None):
+    stats = AltitudeStats(altitude_edges, VALUE_EDGES[product] if value_edges is None else value_edges)
+    args = (product, lat_step, altitude_edges, value_edges, cache)
+    for file, file_stats in run_per_file(granule_stats, files, args, workers):
+        print(f"Statistics of file: {file}")
+        stats.merge(file_stats)
+    return stats
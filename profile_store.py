@@ -0,0 +1,121 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+# Fields stored for every profile next to its values and altitudes
+INDEX_FIELDS = ['granule', 'product', 'grid_lat', 'grid_lon', 'point_number', 'lat', 'lon']
+
+
+# Function to get the centre sample of a matched latitude/longitude (L2 files have 3 per profile)
+def _centre(value):
+    value = np.ravel(value)
+    return value[len(value) // 2]
+
+
+# Writer of the selected profiles to a directory of .npz parts.
+# Every part holds up to chunk_profiles profiles: the index fields, and the values and altitudes of
+# all its profiles joined in two float32 arrays with the offsets where every profile starts.
+# An existing store in the directory is replaced when the writer is created, except the parts in keep
+# (paths of parts written before, for the granules a resumed run does not process again).
+# written holds the paths of the parts written by this writer.
+class ProfileStoreWriter:
+    def __init__(self, path, chunk_profiles=10000, keep=()):
+        self.path = path
+        self.chunk_profiles = chunk_profiles
+        os.makedirs(path, exist_ok=True)
+        keep = {os.path.normpath(part) for part in keep}
+        self.parts = 0
+        for part in sorted(glob.glob(os.path.join(path, 'part_*.npz'))):
+            if os.path.normpath(part) in keep:
+                self.parts = int(os.path.basename(part)[5:-4]) + 1
+            else:
+                os.remove(part)
+        self.written = []
+        self._reset()
+
+    def _reset(self):
+        self.index = {field: [] for field in INDEX_FIELDS}
+        self.values = []
+        self.altitudes = []
+
+    def add(self, file, product, grid_lat, grid_lon, point_number, lat, lon, values, altitudes):
+        for field, value in zip(INDEX_FIELDS, (file, product, grid_lat, grid_lon, point_number, _centre(lat), _centre(lon))):
+            self.index[field].append(value)
+        self.values.append(np.asarray(values, dtype=np.float32))
+        self.altitudes.append(np.asarray(altitudes, dtype=np.float32))
+        if len(self.values) >= self.chunk_profiles:
+            self.flush()
+
+    def flush(self):
+        if not self.values:
+            return
+        lengths = [len(values) for values in self.values]
+        part = os.path.join(self.path, f'part_{self.parts:05d}.npz')
+        np.savez(part,
+                 granule=np.array(self.index['granule'], dtype=str),
+                 product=np.array(self.index['product'], dtype=str),
+                 grid_lat=np.array(self.index['grid_lat'], dtype=np.float32),
+                 grid_lon=np.array(self.index['grid_lon'], dtype=np.float32),
+                 point_number=np.array(self.index['point_number'], dtype=np.int32),
+                 lat=np.array(self.index['lat'], dtype=np.float32),
+                 lon=np.array(self.index['lon'], dtype=np.float32),
+                 offsets=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+                 values=np.concatenate(self.values),
+                 altitudes=np.concatenate(self.altitudes))
+        self.written.append(part)
+        self.parts += 1
+        self._reset()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Reader of a profile store. index is a DataFrame with one row per profile (the index fields plus
+# the part and the position of its values), in granule order; the values are only read from a part when asked for.
+class ProfileStore:
+    def __init__(self, path):
+        self.parts = sorted(glob.glob(os.path.join(path, 'part_*.npz')))
+        frames = []
+        for part_number, part in enumerate(self.parts):
+            with np.load(part) as data:
+                frame = pd.DataFrame({field: data[field] for field in INDEX_FIELDS})
+                frame['part'] = part_number
+                frame['start'] = data['offsets'][:-1]
+                frame['stop'] = data['offsets'][1:]
+            frames.append(frame)
+        columns = INDEX_FIELDS + ['part', 'start', 'stop']
+        self.index = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+        # Parts rewritten by a resumed run come after the kept ones, the granules are put back in order
+        self.index = self.index.sort_values('granule', kind='stable', ignore_index=True)
+        self._part_number = None
+        self._part_data = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def _part(self, part_number):
+        if part_number != self._part_number:
+            with np.load(self.parts[part_number]) as data:
+                self._part_data = (data['values'], data['altitudes'])
+            self._part_number = part_number
+        return self._part_data
+
+    # Function to get (values, altitudes) of the profile in row i of the index
+    def profile(self, i):
+        row = self.index.iloc[i]
+        values, altitudes = self._part(int(row['part']))
+        return values[row['start']:row['stop']], altitudes[row['start']:row['stop']]
+
+    # Function to iterate over (index row, values, altitudes), for the rows of index (a filtered self.index) or all
+    def profiles(self, index=None):
+        index = self.index if index is None else index
+        for i, row in zip(index.index, index.itertuples(index=False)):
+            values, altitudes = self._part(row.part)
+            yield self.index.loc[i], values[row.start:row.stop], altitudes[row.start:row.stop]
@@ -0,0 +1,73 @@
+import os
+import json
+import time
+
+
+# Manifest of the inputs a batch run has already processed, so a rerun only redoes what is new or stale.
+# Every finished input is appended as one JSON line: its path, size, mtime, the parameters of the run and the
+# outputs it produced. An input is done when none of these changed and all its outputs still exist.
+# The last line of an input wins; the file is compacted to one line per input when it is opened.
+# force=True ignores what the manifest holds, so everything is processed again.
+class RunManifest:
+    def __init__(self, path, params=None, force=False):
+        self.path = path
+        self.params = self._normalize(params)
+        self.entries = {}
+        if os.path.exists(path) and not force:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Line cut by a crash
+                    self.entries[entry['file']] = entry
+        self._compact()
+
+    # Function to turn parameters into what they look like after a JSON round trip, so they compare equal
+    @staticmethod
+    def _normalize(params):
+        return json.loads(json.dumps(params, sort_keys=True, default=str))
+
+    def _compact(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def entry(self, file):
+        return self.entries.get(os.path.abspath(file))
+
+    # Function to check if file was processed with the same parameters (the run ones when params is None)
+    # and is unchanged since, and all its outputs are still there
+    def is_done(self, file, params=None):
+        entry = self.entry(file)
+        if entry is None:
+            return False
+        stat = os.stat(file)
+        params = self.params if params is None else self._normalize(params)
+        return (entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns and entry['params'] == params
+                and all(os.path.exists(output) for output in entry['outputs']))
+
+    # Function to get the outputs recorded for file
+    def outputs(self, file):
+        entry = self.entry(file)
+        return [] if entry is None else entry['outputs']
+
+    # Function to record that file is finished, call it only once its outputs are written
+    def record(self, file, outputs, params=None):
+        stat = os.stat(file)
+        entry = {
+            'file': os.path.abspath(file),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'params': self.params if params is None else self._normalize(params),
+            'outputs': sorted(set(outputs)),
+            'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.entries[entry['file']] = entry
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
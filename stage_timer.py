@@ -0,0 +1,53 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+
+# Wall time and call count of the stages of a job, plus free counters (files, grid points, plots...).
+# Timers of worker processes are sent back with their results and combined with merge.
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + other.calls[name]
+        for name, n in other.counters.items():
+            self.count(name, n)
+        return self
+
+    def to_dict(self):
+        return {
+            'stages': {name: {'seconds': round(self.seconds[name], 6), 'calls': self.calls[name]} for name in self.seconds},
+            'counters': dict(self.counters),
+        }
+
+    # Function to format the stages (slowest first) and counters as a text table
+    def report(self):
+        lines = [f"{'Stage':<20}{'Seconds':>12}{'Calls':>10}"]
+        for name in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            lines.append(f"{name:<20}{self.seconds[name]:>12.3f}{self.calls[name]:>10}")
+        for name, n in self.counters.items():
+            lines.append(f"{name:<20}{n:>22}")
+        return '\n'.join(lines)
+
+    def save_json(self, path, **extra):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({**extra, **self.to_dict()}, f, indent=2)
@@ -0,0 +1,263 @@
+import os
+import numpy as np
+import pandas as pd
+from pyhdf.SD import SD, SDC
+from pyhdf.HDF import HDF, HC
+import pyhdf.VS
+
+FILL_VALUE = -9999
+
+# Size of a full granule of every product, the generator writes a fraction (scale) of it
+FULL_SIZE = {
+    'l1': 56250,      # L1 profiles (333 m) of a half orbit
+    'l2pro': 3728,    # L2 5 km profiles
+    'lay': 3728,      # L2 5 km layer records
+    'vfm': 3728,      # VFM records (5515 bins each)
+    'fires': 500000,  # MODIS detections of a season
+}
+
+# Products in the core metadata of the granules, the altitude grid is shared by the granules of a product
+SHORT_NAMES = {
+    'l1': 'CAL_LID_L1-Standard-V4-51',
+    'l2pro': 'CAL_LID_L2_05kmAPro-Standard-V4-51',
+    'lay': 'CAL_LID_L2_05kmALay-Standard-V4-51',
+    'vfm': 'CAL_LID_L2_VFM-Standard-V4-51',
+}
+VERSION_ID = 51
+
+CORE_METADATA = """GROUP                  = INVENTORYMETADATA
+  GROUPTYPE            = MASTERGROUP
+
+  GROUP                  = COLLECTIONDESCRIPTIONCLASS
+
+    OBJECT                 = SHORTNAME
+      NUM_VAL              = 1
+      VALUE                = "{short_name}"
+    END_OBJECT             = SHORTNAME
+
+    OBJECT                 = VERSIONID
+      NUM_VAL              = 1
+      VALUE                = {version_id}
+    END_OBJECT             = VERSIONID
+
+  END_GROUP              = COLLECTIONDESCRIPTIONCLASS
+
+END_GROUP              = INVENTORYMETADATA
+
+END
+"""
+
+L1_ALTITUDES = np.linspace(40.0, -2.0, 583)
+L2_ALTITUDES = np.linspace(30.1, -0.5, 399)
+N_LAYERS = 8
+
+
+# Function to write the metadata vdata with Lidar_Data_Altitudes, like the CALIPSO L1/L2 files
+def write_altitudes(path, altitudes):
+    hdf = HDF(path, HC.WRITE)
+    vs = hdf.vstart()
+    vd = vs.create('metadata', [('Lidar_Data_Altitudes', HC.FLOAT32, len(altitudes))])
+    vd.write([[[float(a) for a in altitudes]]])
+    vd.detach()
+    vs.end()
+    hdf.close()
+
+
+# Function to write one SDS
+def write_dataset(sd, name, data):
+    types = {np.dtype(np.float32): SDC.FLOAT32, np.dtype(np.float64): SDC.FLOAT64, np.dtype(np.uint16): SDC.UINT16}
+    sds = sd.create(name, types[data.dtype], data.shape)
+    sds.setfillvalue(float(FILL_VALUE) if data.dtype.kind == 'f' else 0)
+    sds[:] = data
+    sds.endaccess()
+
+
+# Function to make the geolocation and time of a descending track over Canada.
+# samples is 1 for L1/VFM and 3 (start, centre, end of the 5 km column) for L2.
+def make_track(n, index=0, samples=1, day=19):
+    centre_lat = np.linspace(72.0, 28.0, n)
+    centre_lon = np.linspace(-130.0, -85.0, n) + 7.0 * (index % 6)
+    centre_time = 230500 + day + (index % 24) / 24 + np.arange(n) * (1.0 / 86400)
+    offsets = np.linspace(-0.02, 0.02, samples) if samples > 1 else np.zeros(1)
+    lat = (centre_lat[:, np.newaxis] + offsets).astype(np.float32)
+    lon = (centre_lon[:, np.newaxis] + offsets).astype(np.float32)
+    time = np.repeat(centre_time[:, np.newaxis], samples, axis=1)
+    return lat, lon, time
+
+
+# Function to write the coremetadata global attribute with the product of the granule, like the CALIPSO files
+def write_core_metadata(sd, kind):
+    sd.attr('coremetadata').set(SDC.CHAR8, CORE_METADATA.format(short_name=SHORT_NAMES[kind], version_id=VERSION_ID))
+
+
+# Function to draw an aerosol layer (bottom and top in km) for every profile, about half of them have none
+def make_layers(rng, n):
+    has_layer = rng.random(n) < 0.5
+    bottom = rng.uniform(0.5, 4.0, n)
+    top = bottom + rng.uniform(0.3, 3.0, n)
+    return has_layer, bottom, top
+
+
+# Function to write a L1 granule with Total_Attenuated_Backscatter_532 (profiles, 583)
+def write_l1(path, n, index=0, seed=0):
+    rng = np.random.default_rng(seed)
+    lat, lon, time = make_track(n, index)
+    has_layer, bottom, top = make_layers(rng, n)
+    inside = has_layer[:, np.newaxis] & (L1_ALTITUDES >= bottom[:, np.newaxis]) & (L1_ALTITUDES <= top[:, np.newaxis])
+
+    backscatter = (1e-4 * np.exp(-L1_ALTITUDES / 8.0)).astype(np.float32) * rng.uniform(0.5, 1.5, (n, len(L1_ALTITUDES))).astype(np.float32)
+    backscatter += inside * rng.uniform(1e-3, 8e-3, (n, 1)).astype(np.float32)
+    backscatter[:, L1_ALTITUDES < 0] = 0  # Below the surface
+
+    sd = SD(path, SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+    write_core_metadata(sd, 'l1')
+    write_dataset(sd, 'Latitude', lat)
+    write_dataset(sd, 'Longitude', lon)
+    write_dataset(sd, 'Profile_UTC_Time', time)
+    write_dataset(sd, 'Total_Attenuated_Backscatter_532', backscatter.astype(np.float32))
+    sd.end()
+    write_altitudes(path, L1_ALTITUDES)
+
+
+# Function to encode feature type and subtype the way Feature_Classification_Flags does
+def encode_flags(feature_type, subtype):
+    return (np.asarray(feature_type, dtype=np.uint16) | (np.asarray(subtype, dtype=np.uint16) << 9)
+            | np.uint16(3 << 3) | np.uint16(1 << 13))
+
+
+# Function to write a L2 PRO granule with the backscatter, depolarization and extinction profiles (profiles, 399)
+# and Atmospheric_Volume_Description. Only the bins inside the aerosol layer have values, the rest is -9999.
+def write_l2pro(path, n, index=0, seed=0):
+    rng = np.random.default_rng(seed)
+    lat, lon, time = make_track(n, index, samples=3)
+    has_layer, bottom, top = make_layers(rng, n)
+    inside = has_layer[:, np.newaxis] & (L2_ALTITUDES >= bottom[:, np.newaxis]) & (L2_ALTITUDES <= top[:, np.newaxis])
+    shape = (n, len(L2_ALTITUDES))
+
+    def profile(low, high):
+        values = rng.uniform(low, high, shape).astype(np.float32)
+        values[~inside] = FILL_VALUE
+        return values
+
+    extinction_532 = profile(0.01, 0.5)
+    extinction_1064 = extinction_532 / rng.uniform(1.5, 4.0, shape).astype(np.float32)
+    extinction_1064[~inside] = FILL_VALUE
+
+    subtype = rng.choice([2, 3, 5, 6], size=(n, 1))
+    description = np.where(inside, encode_flags(3, subtype), encode_flags(1, 0)).astype(np.uint16)
+
+    sd = SD(path, SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+    write_core_metadata(sd, 'l2pro')
+    write_dataset(sd, 'Latitude', lat)
+    write_dataset(sd, 'Longitude', lon)
+    write_dataset(sd, 'Profile_UTC_Time', time)
+    write_dataset(sd, 'Total_Backscatter_Coefficient_532', profile(1e-4, 1e-2))
+    write_dataset(sd, 'Particulate_Depolarization_Ratio_Profile_532', profile(0.01, 0.4))
+    write_dataset(sd, 'Extinction_Coefficient_532', extinction_532)
+    write_dataset(sd, 'Extinction_Coefficient_1064', extinction_1064)
+    write_dataset(sd, 'Atmospheric_Volume_Description', np.stack([description, description], axis=2))
+    sd.end()
+    write_altitudes(path, L2_ALTITUDES)
+
+
+# Function to write a L2 LAY granule: up to 8 layers per record with their top/base altitude and flags
+def write_lay(path, n, index=0, seed=0):
+    rng = np.random.default_rng(seed)
+    lat, lon, time = make_track(n, index, samples=3)
+    layers = rng.integers(0, 4, n)
+    used = np.arange(N_LAYERS) < layers[:, np.newaxis]
+
+    base = np.sort(rng.uniform(0.2, 12.0, (n, N_LAYERS)), axis=1)[:, ::-1].astype(np.float32)
+    top = base + rng.uniform(0.1, 1.5, (n, N_LAYERS)).astype(np.float32)
+    base[~used] = FILL_VALUE
+    top[~used] = FILL_VALUE
+    feature_type = rng.choice([2, 3, 3, 3], size=(n, N_LAYERS))
+    subtype = rng.integers(1, 8, (n, N_LAYERS))
+    flags = np.where(used, encode_flags(feature_type, subtype), 0).astype(np.uint16)
+
+    sd = SD(path, SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+    write_core_metadata(sd, 'lay')
+    write_dataset(sd, 'Latitude', lat)
+    write_dataset(sd, 'Longitude', lon)
+    write_dataset(sd, 'Profile_UTC_Time', time)
+    write_dataset(sd, 'Feature_Classification_Flags', flags)
+    write_dataset(sd, 'Layer_Top_Altitude', top)
+    write_dataset(sd, 'Layer_Base_Altitude', base)
+    sd.end()
+
+
+# Function to write a VFM granule with Feature_Classification_Flags (records, 5515)
+def write_vfm(path, n, index=0, seed=0):
+    rng = np.random.default_rng(seed)
+    lat, lon, time = make_track(n, index)
+    bins = 5515
+    feature_type = rng.choice([1, 1, 1, 2, 3, 3, 4, 5], size=(n, bins))
+    subtype = rng.integers(0, 8, (n, bins))
+
+    sd = SD(path, SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+    write_core_metadata(sd, 'vfm')
+    write_dataset(sd, 'Latitude', lat)
+    write_dataset(sd, 'Longitude', lon)
+    write_dataset(sd, 'Profile_UTC_Time', time)
+    write_dataset(sd, 'Feature_Classification_Flags', encode_flags(feature_type, subtype).astype(np.uint16))
+    sd.end()
+
+
+# Function to write a MODIS active fire CSV with the columns of the FIRMS downloads, May-June 2023 over Canada
+def write_fires(path, n, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2023-05-01') + pd.to_timedelta(rng.integers(0, 61, n), unit='D')
+    data = pd.DataFrame({
+        'latitude': np.round(rng.uniform(42, 70, n), 4),
+        'longitude': np.round(rng.uniform(-140, -52, n), 4),
+        'brightness': np.round(rng.uniform(300, 500, n), 1),
+        'scan': np.round(rng.uniform(1, 4, n), 1),
+        'track': np.round(rng.uniform(1, 2, n), 1),
+        'acq_date': dates.strftime('%Y-%m-%d'),
+        'acq_time': rng.integers(0, 24, n) * 100 + rng.integers(0, 60, n),
+        'satellite': rng.choice(['Terra', 'Aqua'], n),
+        'instrument': 'MODIS',
+        'confidence': rng.integers(0, 101, n),
+        'version': '6.1NRT',
+        'bright_t31': np.round(rng.uniform(270, 310, n), 1),
+        'frp': np.round(rng.uniform(1, 500, n), 1),
+        'daynight': rng.choice(['D', 'N'], n),
+        'type': 0,
+    })
+    data.to_csv(path, index=False)
+
+
+# Function to write a whole synthetic archive under directory, with scale times the size of real granules.
+# Returns {kind: [paths]} with the folders 'L1', 'L2 PRO', 'L2 LAY', 'VFM' and the fire CSV.
+# The L2 files are named ..._PRO.hdf / ..._LAY.hdf like the Layer 2 work list expects.
+def write_archive(directory, granules=2, scale=0.1, seed=0):
+    sizes = {kind: max(10, int(round(size * scale))) for kind, size in FULL_SIZE.items()}
+    writers = {
+        'l1': ('L1', '{i:03d}_2_L1.hdf', write_l1),
+        'l2pro': ('L2 PRO', '{i:03d}_PRO.hdf', write_l2pro),
+        'lay': ('L2 LAY', '{i:03d}_LAY.hdf', write_lay),
+        'vfm': ('VFM', '{i:03d}_1_VFM.hdf', write_vfm),
+    }
+    archive = {}
+    for kind, (folder, name, write) in writers.items():
+        os.makedirs(os.path.join(directory, folder), exist_ok=True)
+        archive[kind] = []
+        for i in range(granules):
+            path = os.path.join(directory, folder, name.format(i=i))
+            write(path, sizes[kind], index=i, seed=seed + i)
+            archive[kind].append(path)
+
+    archive['fires'] = [os.path.join(directory, 'modis_2023_Canada.csv')]
+    write_fires(archive['fires'][0], sizes['fires'], seed)
+    archive['sizes'] = sizes
+    return archive
+
+
+if __name__ == '__main__':
+    # Folder of the synthetic archive, number of granules of every product and their size (1 = real size)
+    directory = 'D:/Diploma/synthetic'
+    granules = 4
+    scale = 1.0
+
+    archive = write_archive(directory, granules, scale)
+    print(f"Synthetic archive written to '{directory}': {archive['sizes']}")
@@ -0,0 +1,64 @@
+import os
+import pandas as pd
+
+
+# Function to read a table by its extension (.parquet, .csv or Excel)
+def read_table(path, columns=None):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        return pd.read_parquet(path, columns=columns)
+    if ext == '.csv':
+        return pd.read_csv(path, usecols=columns)
+    return pd.read_excel(path, usecols=columns)
+
+
+# Writer appending DataFrames to a Parquet or CSV file while a job runs.
+# Parquet gets one row group per write (needs pyarrow), CSV one block of lines.
+# An existing file is replaced when the writer is created, unless append=True (CSV only).
+# When columns is given and nothing was written, close() writes an empty table with these columns,
+# so the file exists for whoever reads it afterwards.
+class TableWriter:
+    def __init__(self, path, append=False, columns=None):
+        self.path = path
+        self.ext = os.path.splitext(path)[1].lower()
+        if self.ext not in ('.parquet', '.csv'):
+            raise ValueError(f"Unsupported output format: {path}")
+        self.columns = columns
+        self._writer = None
+        self._header = not (append and self.ext == '.csv' and os.path.exists(path))
+        if not append and os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        if len(df) == 0:
+            return
+        if self.ext == '.csv':
+            df.to_csv(self.path, mode='a', header=self._header, index=False)
+            self._header = False
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self.columns is not None and not os.path.exists(self.path):
+            empty = pd.DataFrame(columns=self.columns)
+            if self.ext == '.csv':
+                empty.to_csv(self.path, index=False)
+            else:
+                empty.to_parquet(self.path, index=False)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
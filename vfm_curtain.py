@@ -0,0 +1,167 @@
+import os
+import glob
+import math
+import numpy as np
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+from matplotlib import colors
+from calipso_granule import CalipsoGranule
+from vfm_decode import decode_vfm
+
+DATAFIELD_NAME = 'Feature_Classification_Flags'
+
+# Layout of a VFM record, only the first profile of every altitude block is used
+N = 290    # 290 is sample number of low height data: -0.5km to 8.2km @ 30m
+N1 = 200   # height data: 8.2 to 20.2 km @ 60m
+N2 = 55    # height data: 20.2 to 30.1km @ 180m
+
+
+# Function to turn VFM records (rows, 5515) into profiles on the 30 m grid (rows, 1020), top altitude first
+def vfm_profiles(data):
+    size = data.shape[0]
+
+    sidx = data.shape[1] - N * 15
+    data_l = np.reshape(data[:, sidx:], (size, 15, N))[:, 0, :]
+
+    sidx1 = sidx - N1 * 5
+    data_m = np.reshape(data[:, sidx1:sidx], (size, 5, N1))[:, 0, :]
+    data_m1 = np.repeat(data_m, 2, axis=1)
+
+    sidx2 = sidx1 - N2 * 3
+    data_m = np.reshape(data[:, sidx2:sidx1], (size, 3, N2))[:, 0, :]
+    data_m2 = np.repeat(data_m, 6, axis=1)
+
+    return np.concatenate([data_m2, data_m1, data_l], axis=1)
+
+
+# Generate altitude data according to file specification
+def vfm_altitudes():
+    return -0.5 + np.arange(N + N1 * 2 + N2 * 6) * 0.03
+
+
+# Convert colors to 0-1 range
+def convert_color(color):
+    return tuple(c / 255.0 for c in color)
+
+
+cols = [
+    convert_color((204, 204, 204)), convert_color((0, 0, 255)), convert_color((255, 240, 0)),
+    convert_color((255, 153, 0)), convert_color((51, 153, 0)), convert_color((120, 51, 0)),
+    'k', convert_color((0, 153, 204)), 'w', convert_color((150, 150, 150)), convert_color((100, 100, 100))
+]
+
+
+# Function to plot an aerosol subtype curtain (altitude x profiles) with the NASA colours.
+# boundaries is an optional list of (column, file) where each granule starts.
+def plot_subtype_curtain(atype, lat, lon, title, tick_step=100, boundaries=None):
+    alt = vfm_altitudes()
+
+    # X axis ticks
+    xvals = []
+    xstrs = []
+    nx = atype.shape[1]
+    for i in range(0, nx, tick_step):
+        xvals.append(i)
+        if i == 0:
+            xstrs.append('Lat: %.2f\nLon: %.2f' % (lat[i], lon[i]))
+        else:
+            xstrs.append('%.2f\n%.2f' % (lat[i], lon[i]))
+
+    # Plot
+    fig, ax = plt.subplots()
+    levs = np.arange(11)
+    cmap = colors.ListedColormap(cols)
+    norm = mpl.colors.BoundaryNorm(levs, cmap.N)
+
+    im = ax.imshow(atype, aspect='auto', cmap=cmap, norm=norm, extent=[0, nx - 1, alt[0], alt[-1]])
+
+    cbar = plt.colorbar(im, ax=ax, shrink=0.8, ticks=levs)
+    cbar.ax.set_yticklabels(['Not Determined', 'Clean Marine', 'Dust', 'Polluted Cont.', 'Clean Cont.',
+                             'Polluted Dust', 'Smoke', 'Dusty marine', 'PSC aerosol', 'Volcanic ash', 'Sulfate/other'])
+
+    # Mark where every granule starts
+    for column, _ in (boundaries or [])[1:]:
+        ax.axvline(column, color='w', linewidth=0.8, linestyle='--')
+
+    ax.set_xticks(xvals)
+    ax.set_xticklabels(xstrs, fontsize=8)
+    ax.set_ylabel('Altitude (km)')
+    ax.set_ylim(-0.5, 10.1)
+    ax.set_title(title)
+    return fig, ax
+
+
+# Function to find the start time of a granule (first Profile_UTC_Time), None if the file has none
+def granule_start_time(granule):
+    try:
+        return float(granule.read('Profile_UTC_Time', slice(0, 1)).ravel()[0])
+    except Exception:
+        return None
+
+
+# Function to build one aerosol subtype curtain across many VFM granules.
+# files is a directory or a list of VFM files; they are put in along-track (time) order.
+# Only the geolocation of every granule is held in memory. The flags are read chunk_rows records
+# at a time, decoded and downsampled to at most max_columns profiles in total, so memory is
+# bounded by the chunk size and the size of the final curtain, not by the number of granules.
+# Returns (atype (altitude, profiles) uint8, lat, lon, boundaries [(column, file), ...]).
+def stream_subtype_curtain(files, max_columns=4000, chunk_rows=2000, lon_range=None, lat_range=None):
+    if isinstance(files, str):
+        files = glob.glob(f"{files}/*.hdf")
+
+    # First pass: geolocation only, to know which records are used
+    granules = []
+    for file in files:
+        try:
+            with CalipsoGranule(file) as granule:
+                lat = granule['Latitude'][:, 0]
+                lon = granule['Longitude'][:, 0]
+                start_time = granule_start_time(granule)
+        except Exception as e:
+            print(f"Error reading file {file}: {e}")
+            continue
+
+        mask = np.ones(len(lat), dtype=bool)
+        if lon_range is not None:
+            mask &= (lon >= lon_range[0]) & (lon <= lon_range[1])
+        if lat_range is not None:
+            mask &= (lat >= lat_range[0]) & (lat <= lat_range[1])
+        rows = np.flatnonzero(mask)
+        if len(rows) > 0:
+            granules.append((start_time, os.path.basename(file), file, rows, lat, lon))
+
+    # Along-track order: by start time, files without a time by name
+    granules.sort(key=lambda g: (g[0] is None, g[0] or 0, g[1]))
+
+    total = sum(len(rows) for _, _, _, rows, _, _ in granules)
+    stride = max(1, math.ceil(total / max_columns))
+
+    curtain = []
+    lats = []
+    lons = []
+    boundaries = []
+    offset = 0  # Number of used records before this granule, keeps the stride continuous across files
+    columns = 0
+    for _, _, file, rows, lat, lon in granules:
+        keep = rows[(offset + np.arange(len(rows))) % stride == 0]
+        offset += len(rows)
+        if len(keep) == 0:
+            continue
+        boundaries.append((columns, file))
+        columns += len(keep)
+        lats.append(lat[keep])
+        lons.append(lon[keep])
+
+        with CalipsoGranule(file) as granule:
+            for start in range(int(keep[0]), int(keep[-1]) + 1, chunk_rows):
+                stop = min(start + chunk_rows, int(keep[-1]) + 1)
+                chunk_keep = keep[(keep >= start) & (keep < stop)]
+                if len(chunk_keep) == 0:
+                    continue
+                data = granule.read(DATAFIELD_NAME, slice(start, stop))[chunk_keep - start]
+                atype = decode_vfm(vfm_profiles(data), ['aerosol_psc_subtype'])['aerosol_psc_subtype']
+                curtain.append(atype)
+
+    if not curtain:
+        raise ValueError("No VFM profiles found in the specified range.")
+    return np.concatenate(curtain).T, np.concatenate(lats), np.concatenate(lons), boundaries
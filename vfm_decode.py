@@ -0,0 +1,48 @@
+import numpy as np
+
+# Bit fields of the 16-bit Feature_Classification_Flags: name -> (shift, mask)
+VFM_BITS = {
+    'feature_type': (0, 7),
+    'feature_qa': (3, 3),
+    'ice_water_phase': (5, 3),
+    'ice_water_phase_qa': (7, 3),
+    'subtype': (9, 7),
+    'subtype_qa': (12, 1),
+    'horizontal_averaging': (13, 7),
+}
+
+
+# Function to build the lookup table: one row per possible flag value, one uint8 column per plane
+def _build_table():
+    flags = np.arange(65536, dtype=np.uint32)
+    planes = {name: ((flags >> shift) & mask).astype(np.uint8) for name, (shift, mask) in VFM_BITS.items()}
+    feature_type = planes['feature_type']
+    subtype = planes['subtype']
+
+    # Tropospheric aerosol subtype (1-7), 0 for any other feature
+    planes['aerosol_subtype'] = np.where(feature_type == 3, subtype, 0).astype(np.uint8)
+
+    # Tropospheric aerosol subtypes 1-7 and stratospheric aerosol / PSC subtypes 1-3 as 9-11,
+    # the codes used by the aerosol subtype curtain plot
+    stratospheric = (feature_type == 4) & (subtype >= 1) & (subtype <= 3)
+    planes['aerosol_psc_subtype'] = (planes['aerosol_subtype'] + np.where(stratospheric, subtype + 8, 0)).astype(np.uint8)
+
+    names = list(planes)
+    return names, np.stack([planes[name] for name in names], axis=1)
+
+
+VFM_PLANES, _VFM_TABLE = _build_table()
+
+
+# Function to decode Feature_Classification_Flags into uint8 planes with a single table lookup.
+# Returns {plane name: array shaped like flags}. The input is never modified.
+def decode_vfm(flags, planes=('feature_type', 'feature_qa', 'ice_water_phase', 'aerosol_psc_subtype', 'horizontal_averaging')):
+    flags = np.asarray(flags)
+    if flags.dtype == np.int16:
+        flags = flags.view(np.uint16)
+    elif flags.dtype != np.uint16:
+        flags = flags.astype(np.uint16)
+
+    columns = [VFM_PLANES.index(name) for name in planes]
+    decoded = _VFM_TABLE[:, columns][flags]
+    return {name: decoded[..., i] for i, name in enumerate(planes)}